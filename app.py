@@ -40,3 +40,28 @@ class CollectFiles(Application):
         # now register the command with the engine
         self.engine.register_command("Collect External Files into Project...", menu_callback)
         
+        # and a dry run that only reports what a collection would do
+        plan_callback = lambda : app_payload.collect_files.plan()
+        self.engine.register_command("Plan External File Collection...", plan_callback)
+        
+        # and packaging the files into an archive for a delivery, rather than into the project
+        package_callback = lambda : app_payload.collect_files.package()
+        self.engine.register_command("Package External Files into Archive...", package_callback)
+        
+        self._app_payload = app_payload
+        
+    def collect_headless(self, overwrite_policy="never"):
+        """
+        Collects the external files of the current scene without any UI, for
+        use from batch scripts such as scripts/collect_nuke_script.py. The
+        caller is responsible for saving the scene afterwards.
+        
+        :overwrite_policy:  "always" to overwrite existing target files,
+                            "never" to keep them.
+        
+        :returns:   Dictionary with the number of 'references_scanned', the
+                    number of objects 'updated' and a sorted list of the
+                    names of the objects that had 'errors'.
+        """
+        return self._app_payload.collect_files.collect_headless(overwrite_policy)
+        
@@ -0,0 +1,541 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Times a whole collection of a synthetic Nuke script, outside of Nuke and
+Toolkit. Lightweight stand-ins replace the nuke module, sgtk, the engine and
+the destination templates, so the real scan, copy and update code runs
+against a scene generated on a temporary filesystem:
+
+    python benchmarks/collection_benchmark.py --reads 200 --frames 100 --shared 0.25
+
+Each repeat starts from empty targets and times the scan_scene hook, the
+copy of the scanned tasks through CollectFiles._start_copy and the
+update_references hook separately, then times the copy again to measure a
+rerun where everything is up to date.
+Finally the scan and copy are timed together into another empty project,
+streaming tasks from the scan straight to the copy workers as a collection
+does, and the scene is packaged into a single archive.
+Results are printed as JSON, and written to --output when given, so they can
+be compared between releases.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import optparse
+import tempfile
+import types
+
+ROOT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HOOKS_FOLDER = os.path.join(ROOT_FOLDER, "hooks")
+PYTHON_FOLDER = os.path.join(ROOT_FOLDER, "python")
+
+HOOKS = {"hook_scan_scene": "scan_scene_tk-nuke.py",
+         "hook_copy_file": "copy_file.py",
+         "hook_update_references": "update_references_tk-nuke.py",
+         "hook_log_metrics": "log_metrics.py",
+         "hook_package_files": "package_files.py",
+         }
+
+
+def load_source(name, path):
+    """
+    Loads the Python file at 'path' as the module 'name'. Uses importlib,
+    as imp is gone from Python 3.12, and imp only on Python 2.
+    """
+    try:
+        import importlib.util
+    except ImportError:
+        import imp
+        return imp.load_source(name, path)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class StandInKnob(object):
+    def __init__(self, value):
+        self._value = value
+
+    def value(self):
+        return self._value
+
+    def setValue(self, value):
+        self._value = value
+
+
+class StandInNode(object):
+    """
+    Just enough of a nuke.Node for a Read node.
+    """
+
+    def __init__(self, name, filename, first=1, last=1, node_class="Read"):
+        self._name = name
+        self._class = node_class
+        self._knobs = {"file": StandInKnob(filename), "first": StandInKnob(first), "last": StandInKnob(last)}
+
+    def __getitem__(self, name):
+        return self._knobs[name]
+
+    def knob(self, name):
+        return self._knobs.get(name)
+
+    def name(self):
+        return self._name
+
+    def fullName(self):
+        return self._name
+
+    def Class(self):
+        return self._class
+
+
+class StandInRoot(object):
+    def __init__(self):
+        self.path = "Root"
+
+    def name(self):
+        return self.path
+
+
+class StandInTemplate(object):
+    """
+    Destination template resolving to <root>/<name>/<pass>/v<version>.
+    """
+
+    def __init__(self, name, root):
+        self.name = name
+        self._root = root
+
+    def apply_fields(self, fields):
+        return os.path.join(self._root, self.name, fields.get("pass", "default"), "v%03d" % fields.get("version", 1))
+
+
+class StandInContext(object):
+    def as_template_fields(self, template):
+        return {}
+
+    def __str__(self):
+        return "Benchmark"
+
+
+class StandInTk(object):
+    def __init__(self, project_path):
+        self.project_path = project_path
+        self.roots = {"primary": project_path}
+        self.templates = {"benchmark_destination": StandInTemplate("collected", project_path)}
+
+
+class StandInEngine(object):
+    def __init__(self, project_path):
+        self.sgtk = StandInTk(project_path)
+        self.context = StandInContext()
+
+    def execute_in_main_thread(self, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    def show_dialog(self, *args, **kwargs):
+        pass
+
+
+class StandInApp(object):
+    """
+    Stands in for the Application: settings, hooks and the app module.
+    """
+
+    def __init__(self, project_path, cache_location, settings):
+        self.engine = StandInEngine(project_path)
+        self.context = self.engine.context
+        self.cache_location = cache_location
+        self._settings = settings
+        self._hooks = {}
+        self._app_module = None
+
+    def get_setting(self, name):
+        return self._settings[name]
+
+    def import_module(self, name):
+        if self._app_module is None:
+            sys.path.insert(0, PYTHON_FOLDER)
+            self._app_module = __import__(name)
+        return self._app_module
+
+    def execute_hook_method(self, key, method, **kwargs):
+        hook = self._hooks.get(key)
+        if hook is None:
+            module = load_source("benchmark_" + key, os.path.join(HOOKS_FOLDER, HOOKS[key]))
+            import sgtk
+            for value in vars(module).values():
+                if isinstance(value, type) and issubclass(value, sgtk.Hook) and value is not sgtk.Hook:
+                    hook = self._hooks[key] = value(self)
+                    break
+        return getattr(hook, method)(**kwargs)
+
+    def log_debug(self, msg):
+        pass
+
+    def log_info(self, msg):
+        pass
+
+    def log_warning(self, msg):
+        sys.stderr.write(msg + "\n")
+
+    def log_error(self, msg):
+        sys.stderr.write(msg + "\n")
+
+    def log_exception(self, msg):
+        import traceback
+        sys.stderr.write(msg + "\n" + traceback.format_exc())
+
+
+def install_stand_ins():
+    """
+    Puts the stand-in nuke and sgtk modules in sys.modules, so the hooks and
+    the app import them instead of the real ones.
+
+    :returns:   The stand-in nuke module.
+    """
+    nuke = types.ModuleType("nuke")
+    nuke.NODES = []
+    nuke.ROOT = StandInRoot()
+    nuke.allNodes = lambda filter=None, group=None, recurseGroups=False: [
+        node for node in nuke.NODES if filter is None or node.Class() == filter]
+    nuke.root = lambda: nuke.ROOT
+    nuke.updateUI = lambda: None
+
+    class Undo(object):
+        begin = staticmethod(lambda name=None: None)
+        end = staticmethod(lambda: None)
+        disable = staticmethod(lambda: None)
+        enable = staticmethod(lambda: None)
+    nuke.Undo = Undo
+
+    class TankError(Exception):
+        pass
+
+    class Hook(object):
+        def __init__(self, parent):
+            self.parent = parent
+
+    class QMessageBox(object):
+        Yes, No, YesToAll, NoToAll = 0x4000, 0x10000, 0x8000, 0x20000
+
+        @staticmethod
+        def question(*args, **kwargs):
+            return QMessageBox.NoToAll
+
+        @staticmethod
+        def information(*args, **kwargs):
+            pass
+
+    sgtk = types.ModuleType("sgtk")
+    sgtk.TankError = TankError
+    sgtk.Hook = Hook
+    sgtk.get_hook_baseclass = lambda: Hook
+    platform = types.ModuleType("sgtk.platform")
+    platform.current_bundle = lambda: platform.BUNDLE
+    platform.current_engine = lambda: platform.BUNDLE.engine
+    qt = types.ModuleType("sgtk.platform.qt")
+    qt.QtGui = types.ModuleType("QtGui")
+    qt.QtGui.QWidget = object
+    qt.QtGui.QMessageBox = QMessageBox
+    qt.QtCore = types.ModuleType("QtCore")
+    platform.qt = qt
+    sgtk.platform = platform
+
+    sys.modules.update({"nuke": nuke, "sgtk": sgtk, "sgtk.platform": platform, "sgtk.platform.qt": qt})
+    return nuke
+
+
+def write_file(path, size, _buffers={}):
+    """
+    Writes 'size' bytes to 'path', reusing one buffer per size.
+    """
+    data = _buffers.get(size)
+    if data is None:
+        data = _buffers[size] = os.urandom(min(size, 1024 * 1024))
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            f.write(data[:remaining])
+            remaining -= len(data)
+
+
+def make_scene(folder, options):
+    """
+    Writes the source files of a synthetic scene under 'folder'.
+
+    Read nodes cycle through image sequences, stills and movies in the
+    proportions given in 'options'. A fraction of them reads the same files
+    as an earlier node, as comps that reuse a plate in several branches do.
+
+    :returns:   Tuple (nodes, files, bytes) with the list of StandInNodes and
+                the number and total size of the distinct source files.
+    """
+    nodes = []
+    files = 0
+    total_bytes = 0
+    shared_every = int(round(1.0 / options.shared)) if options.shared > 0 else 0
+    kinds = (["sequence"] * options.sequence_weight + ["still"] * options.still_weight +
+             ["movie"] * options.movie_weight)
+
+    for index in range(options.reads):
+        name = "Read%d" % (index + 1)
+        if shared_every and index and index % shared_every == 0:
+            earlier = nodes[(index * 7919) % len(nodes)]
+            nodes.append(StandInNode(name, earlier["file"].value(),
+                                     earlier["first"].value(), earlier["last"].value()))
+            continue
+
+        kind = kinds[index % len(kinds)]
+        source_folder = os.path.join(folder, "%s%04d" % (kind, index))
+        os.makedirs(source_folder)
+        if kind == "sequence":
+            pattern = os.path.join(source_folder, "plate%04d_v001.%%04d.exr" % index)
+            for frame in range(1, options.frames + 1):
+                write_file(pattern % frame, options.frame_size)
+            nodes.append(StandInNode(name, pattern.replace("\\", "/"), 1, options.frames))
+            files += options.frames
+            total_bytes += options.frames * options.frame_size
+        elif kind == "still":
+            path = os.path.join(source_folder, "still%04d_v001.jpg" % index)
+            write_file(path, options.still_size)
+            nodes.append(StandInNode(name, path.replace("\\", "/")))
+            files += 1
+            total_bytes += options.still_size
+        else:
+            path = os.path.join(source_folder, "movie%04d_v001.mov" % index)
+            write_file(path, options.movie_size)
+            nodes.append(StandInNode(name, path.replace("\\", "/")))
+            files += 1
+            total_bytes += options.movie_size
+    return nodes, files, total_bytes
+
+
+def fresh_nodes(nodes):
+    """
+    :returns:   Copies of 'nodes', as a scene that hasn't been collected yet.
+    """
+    return [StandInNode(node.name(), node["file"].value(), node["first"].value(), node["last"].value())
+            for node in nodes]
+
+
+def settings_for(options):
+    """
+    :returns:   The app settings used for the benchmark.
+    """
+    item_type = lambda name, extensions: {"type": name, "extensions": extensions,
+                                          "destination_path_template": "benchmark_destination"}
+    return {"scene_item_types": [item_type("read_node_sequence", [".exr"]),
+                                 item_type("read_node_movie", [".mov"]),
+                                 item_type("read_node_still", [".jpg"])],
+            "copy_threads": options.threads,
+            "copy_threads_per_volume": options.threads_per_volume,
+            "copy_batch_size": options.batch_size,
+            "max_bytes_per_second": options.max_bytes_per_second,
+            "low_priority_copies": options.low_priority,
+            "batch_reference_updates": not options.unbatched_updates,
+            "incremental_reference_updates": options.incremental_updates,
+            "verify_copies": options.verify,
+            "package_format": options.package_format,
+            "package_compression": "fast" if options.package_fast else "none",
+            # the stand-in root can't save a copy of the script
+            "package_relinked_script": False,
+            "run_in_background": False,
+            "link_mode": "none",
+            "directory_sync": True,
+            "respect_frame_range": True,
+            "frame_range_handles": 0,
+            "project_path_aliases": [],
+            "overwrite_policy": "always",
+            }
+
+
+def timed(func, *args, **kwargs):
+    """
+    :returns:   Tuple (seconds, result of func).
+    """
+    start = time.time()
+    result = func(*args, **kwargs)
+    return time.time() - start, result
+
+
+def copy_scanned(collector, tasks):
+    """
+    Copies the files of tasks that were already scanned, planning and
+    queuing them one by one as CollectFiles._scan_and_start_copy does.
+
+    :returns:   Set of the names of the tasks that had errors.
+    """
+    collector._resolve_scene_path()
+    plan = collector._start_plan()
+    engine = collector._start_copy()
+    for i, task in enumerate(tasks):
+        new_files = collector._plan_task(plan, i, task)
+        collector._submit(engine, collector._approve(task, new_files) if new_files else [])
+    return collector._finish_copy(tasks, engine)
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {"runs": ordered, "min": ordered[0], "median": ordered[len(ordered) // 2], "max": ordered[-1]}
+
+
+def run(options):
+    nuke = install_stand_ins()
+    import sgtk
+
+    work_folder = tempfile.mkdtemp(prefix="collection_benchmark_", dir=options.temp_dir)
+    try:
+        source_folder = os.path.join(work_folder, "sources")
+        os.makedirs(source_folder)
+        nodes, files, total_bytes = make_scene(source_folder, options)
+
+        timings = {"scan": [], "copy": [], "update": [], "copy_rerun": [], "scan_and_copy_streaming": [], "package": []}
+        references = updated = 0
+        for repeat in range(options.repeats):
+            project_path = os.path.join(work_folder, "project%d" % repeat)
+            cache_location = os.path.join(work_folder, "cache%d" % repeat)
+            os.makedirs(project_path)
+            os.makedirs(cache_location)
+
+            app = StandInApp(project_path, cache_location, settings_for(options))
+            sgtk.platform.BUNDLE = app
+            nuke.ROOT.path = os.path.join(work_folder, "benchmark_v001.nk")
+            nuke.NODES[:] = fresh_nodes(nodes)
+            collect_files = app.import_module("app").collect_files
+
+            seconds, (references, tasks) = timed(app.execute_hook_method, "hook_scan_scene", "execute")
+            timings["scan"].append(seconds)
+
+            seconds, bad_object_names = timed(copy_scanned, collect_files.CollectFiles(headless=True), tasks)
+            timings["copy"].append(seconds)
+            if bad_object_names:
+                sys.stderr.write("Failed to copy: %s\n" % ", ".join(sorted(bad_object_names)))
+
+            seconds, (updated, _) = timed(app.execute_hook_method, "hook_update_references", "execute",
+                                          tasks=tasks)
+            timings["update"].append(seconds)
+
+            # the update pointed the nodes into the project, so the rerun
+            # scans the original scene again, untimed
+            nuke.NODES[:] = fresh_nodes(nodes)
+            rerun_tasks = app.execute_hook_method("hook_scan_scene", "execute")[1]
+            seconds, _ = timed(copy_scanned, collect_files.CollectFiles(headless=True), rerun_tasks)
+            timings["copy_rerun"].append(seconds)
+
+            # the same scan and copy again, into a fresh project, with the
+            # copies starting as the scan yields its tasks
+            stream_path = project_path + "_streaming"
+            os.makedirs(stream_path)
+            app = StandInApp(stream_path, cache_location + "_streaming", settings_for(options))
+            sgtk.platform.BUNDLE = app
+            nuke.NODES[:] = fresh_nodes(nodes)
+            collector = collect_files.CollectFiles(headless=True)
+
+            def stream():
+                references, tasks, engine = collector._scan_and_start_copy()
+                if collector._relink_queue is not None:
+                    collector._relink_as_copied(tasks)
+                return collector._finish_copy(tasks, engine)
+            seconds, bad_object_names = timed(stream)
+            timings["scan_and_copy_streaming"].append(seconds)
+            if bad_object_names:
+                sys.stderr.write("Failed to copy: %s\n" % ", ".join(sorted(bad_object_names)))
+
+            # the same scene again, into one archive rather than a project
+            nuke.NODES[:] = fresh_nodes(nodes)
+            archive_path = os.path.join(work_folder, "package%d.%s" % (repeat, options.package_format))
+            seconds, path_map = timed(collect_files.CollectFiles(headless=True).package, archive_path)
+            timings["package"].append(seconds)
+            if path_map["failures"]:
+                sys.stderr.write("Failed to package: %s\n" % ", ".join(failure["source"] for failure in path_map["failures"]))
+
+            if not options.keep:
+                shutil.rmtree(project_path, ignore_errors=True)
+                shutil.rmtree(stream_path, ignore_errors=True)
+                os.remove(archive_path)
+
+        results = dict((phase, summarize(samples)) for phase, samples in timings.items())
+        results["copy"]["mb_per_second"] = total_bytes / (1024.0 ** 2) / max(results["copy"]["median"], 1e-9)
+        results["scan"]["reads_per_second"] = options.reads / max(results["scan"]["median"], 1e-9)
+        return {"python": sys.version.split()[0],
+                "scene": {"reads": options.reads,
+                          "frames": options.frames,
+                          "shared": options.shared,
+                          "source_files": files,
+                          "source_bytes": total_bytes,
+                          },
+                "references_scanned": references,
+                "updated": updated,
+                "threads": options.threads,
+                "threads_per_volume": options.threads_per_volume,
+                "phases": results,
+                }
+    finally:
+        if options.keep:
+            sys.stderr.write("Kept benchmark files in %s\n" % work_folder)
+        else:
+            shutil.rmtree(work_folder, ignore_errors=True)
+
+
+def main(argv):
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("--reads", type="int", default=100, help="number of Read nodes [%default]")
+    parser.add_option("--frames", type="int", default=50, help="frames per image sequence [%default]")
+    parser.add_option("--shared", type="float", default=0.2,
+                      help="fraction of Read nodes reading the files of another node [%default]")
+    parser.add_option("--sequence-weight", type="int", default=6, help="relative number of sequences [%default]")
+    parser.add_option("--still-weight", type="int", default=3, help="relative number of stills [%default]")
+    parser.add_option("--movie-weight", type="int", default=1, help="relative number of movies [%default]")
+    parser.add_option("--frame-size", type="int", default=64 * 1024, help="bytes per frame [%default]")
+    parser.add_option("--still-size", type="int", default=256 * 1024, help="bytes per still [%default]")
+    parser.add_option("--movie-size", type="int", default=16 * 1024 * 1024, help="bytes per movie [%default]")
+    parser.add_option("--threads", type="int", default=8, help="copy_threads setting [%default]")
+    parser.add_option("--threads-per-volume", type="int", default=4,
+                      help="copy_threads_per_volume setting [%default]")
+    parser.add_option("--batch-size", type="int", default=32,
+                      help="copy_batch_size setting, 1 to copy one file per hook call [%default]")
+    parser.add_option("--max-bytes-per-second", type="int", default=0,
+                      help="max_bytes_per_second setting, 0 for no limit [%default]")
+    parser.add_option("--low-priority", action="store_true", help="low_priority_copies setting")
+    parser.add_option("--unbatched-updates", action="store_true",
+                      help="turn the batch_reference_updates setting off")
+    parser.add_option("--incremental-updates", action="store_true",
+                      help="incremental_reference_updates setting, relinks during the streaming run")
+    parser.add_option("--verify", action="store_true", help="verify_copies setting")
+    parser.add_option("--package-format", default="tar", choices=["tar", "zip"],
+                      help="package_format setting [%default]")
+    parser.add_option("--package-fast", action="store_true", help="package_compression setting \"fast\"")
+    parser.add_option("--repeats", type="int", default=3, help="number of runs [%default]")
+    parser.add_option("--temp-dir", help="folder to generate the scene in, e.g. on a network mount")
+    parser.add_option("--keep", action="store_true", help="don't delete the generated files")
+    parser.add_option("--output", help="also write the results as JSON to this file")
+    options, args = parser.parse_args(argv)
+    if args:
+        parser.error("unexpected arguments: %s" % " ".join(args))
+    if options.repeats < 1 or options.reads < 1:
+        parser.error("--reads and --repeats must be at least 1")
+
+    output = json.dumps(run(options), indent=4, sort_keys=True)
+    print(output)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,179 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Measures the throughput of the copy_file hook against a plain shutil.copy,
+which is what the hook used to do.
+
+Run it once with a local target folder and once with a target on the NFS or
+SMB mount you want to measure, e.g.:
+
+    python benchmarks/copy_throughput.py --source-dir /tmp/bench_src --target-dir /mnt/projects/tmp/bench
+
+Results are printed as JSON, in MB/s per file size and copy method. Source
+files are read once before timing so they come from the page cache, which
+isolates the cost of the write side; drop the caches between runs if you
+want to include reads from disk.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import optparse
+import tempfile
+import types
+
+HOOKS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "hooks")
+
+
+def load_source(name, path):
+    """
+    Loads the Python file at 'path' as the module 'name'. Uses importlib,
+    as imp is gone from Python 3.12, and imp only on Python 2.
+    """
+    try:
+        import importlib.util
+    except ImportError:
+        import imp
+        return imp.load_source(name, path)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_copy_hook():
+    """
+    Loads the copy_file hook outside of Toolkit. The hook only needs sgtk for
+    its base class, so a plain object is used when sgtk isn't importable.
+    """
+    try:
+        import sgtk
+    except ImportError:
+        sgtk = types.ModuleType("sgtk")
+        sgtk.get_hook_baseclass = lambda: object
+        sys.modules["sgtk"] = sgtk
+    module = load_source("copy_file_hook", os.path.join(HOOKS_FOLDER, "copy_file.py"))
+    return module.CopyFile()
+
+
+def parse_size(text):
+    """
+    Parses sizes like '8K', '4M' or '2G' into bytes.
+    """
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = text.strip().upper()
+    if text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def make_source(folder, size):
+    """
+    Writes a file of random data of 'size' bytes and returns its path.
+    """
+    path = os.path.join(folder, "source_%d.bin" % size)
+    if not os.path.isfile(path) or os.path.getsize(path) != size:
+        with open(path, "wb") as f:
+            remaining = size
+            while remaining:
+                chunk = min(remaining, 8 * 1024 * 1024)
+                f.write(os.urandom(chunk))
+                remaining -= chunk
+    # warm the page cache
+    with open(path, "rb") as f:
+        while f.read(8 * 1024 * 1024):
+            pass
+    return path
+
+
+def time_copies(copy, source, target_folder, count):
+    """
+    Copies 'source' into 'target_folder' 'count' times and returns the
+    elapsed time in seconds.
+    """
+    targets = [os.path.join(target_folder, "target_%d.bin" % i) for i in range(count)]
+    for target in targets:
+        if os.path.exists(target):
+            os.remove(target)
+    start = time.time()
+    for target in targets:
+        copy(source, target)
+    elapsed = time.time() - start
+    for target in targets:
+        os.remove(target)
+    return elapsed
+
+
+def measure(options, source_dir, target_dir):
+    """
+    Times each copy method for each of the sizes in 'options'.
+
+    :returns:   Dictionary of the results.
+    """
+    hook = load_copy_hook()
+    methods = [("shutil.copy", shutil.copy),
+               ("copy_file hook", lambda source, target: hook.execute(source, target)),
+               ]
+
+    total = parse_size(options.total)
+    results = {"source_dir": source_dir, "target_dir": target_dir, "python": sys.version.split()[0], "sizes": []}
+    for size in [parse_size(text) for text in options.sizes.split(",")]:
+        source = make_source(source_dir, size)
+        count = max(1, min(1000, total // max(size, 1)))
+        entry = {"size": size, "files": count, "mb_per_second": {}}
+        for name, copy in methods:
+            elapsed = time_copies(copy, source, target_dir, count)
+            entry["mb_per_second"][name] = round(size * count / (1024.0 * 1024.0) / max(elapsed, 1e-9), 1)
+        baseline = entry["mb_per_second"]["shutil.copy"]
+        if baseline:
+            entry["speedup"] = round(entry["mb_per_second"]["copy_file hook"] / baseline, 2)
+        results["sizes"].append(entry)
+        os.remove(source)
+    return results
+
+
+def main():
+    parser = optparse.OptionParser(usage=__doc__)
+    parser.add_option("--source-dir", help="Folder to create the source files in.")
+    parser.add_option("--target-dir", help="Folder to copy into, e.g. on the mount to measure.")
+    parser.add_option("--sizes", default="8K,1M,32M,512M",
+                      help="Comma separated file sizes to test. [default: %default]")
+    parser.add_option("--total", default="1G",
+                      help="Approximate amount of data copied per size and method. [default: %default]")
+    options, args = parser.parse_args()
+
+    # only the folders made here are removed at the end
+    temp_dirs = []
+    source_dir = options.source_dir
+    if not source_dir:
+        source_dir = tempfile.mkdtemp(prefix="collectfiles_bench_src_")
+        temp_dirs.append(source_dir)
+    target_dir = options.target_dir
+    if not target_dir:
+        target_dir = tempfile.mkdtemp(prefix="collectfiles_bench_dst_")
+        temp_dirs.append(target_dir)
+    try:
+        for folder in (source_dir, target_dir):
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+        results = measure(options, source_dir, target_dir)
+    finally:
+        for folder in temp_dirs:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    print(json.dumps(results, indent=2, sort_keys=True))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,19 +9,107 @@
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
 import os
+import io
+import sys
+import mmap
+import errno
 import shutil
+import hashlib
 import sgtk
 import re
 
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
 HookClass = sgtk.get_hook_baseclass()
 
+# Appended to the target path while a copy is in progress.
+PARTIAL_SUFFIX = ".partial"
+
+# Returned for a file that wasn't copied because the target was already an
+# unchanged copy of the source.
+UP_TO_DATE = "up_to_date"
+
+# Errors meaning a kernel copy isn't possible between two files, e.g. because
+# they are on different filesystems, rather than that the copy went wrong.
+_UNSUPPORTED_ERRNOS = set(getattr(errno, name) for name in
+                          ("EXDEV", "EINVAL", "ENOSYS", "EOPNOTSUPP", "ENOTSUP", "EBADF")
+                          if hasattr(errno, name))
+
+# ioctl request to clone a file on Linux, from linux/fs.h
+_FICLONE = 0x40049409
+
+# fallocate mode that reserves space without changing the file size, from
+# linux/falloc.h
+_FALLOC_FL_KEEP_SIZE = 0x01
+
+
+def _hash_algorithm():
+    """
+    Returns a tuple (name, constructor) for the fastest hash available to
+    verify copies with: xxhash if it is installed, then BLAKE2 (Python 3.6+)
+    and md5 everywhere else.
+    """
+    if xxhash is not None:
+        if hasattr(xxhash, "xxh3_128"):
+            return "xxh3_128", xxhash.xxh3_128
+        return "xxh64", xxhash.xxh64
+    if hasattr(hashlib, "blake2b"):
+        return "blake2b", hashlib.blake2b
+    return "md5", hashlib.md5
+
+
+def _load_fallocate():
+    """
+    Returns a function taking (fd, size) that reserves 'size' bytes for a
+    file without changing its size, or None where that isn't possible. Only
+    Linux has this, through fallocate with FALLOC_FL_KEEP_SIZE. The portable
+    posix_fallocate grows the file instead.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fallocate = libc.fallocate64
+    except (OSError, AttributeError):
+        return None
+    fallocate.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64)
+    fallocate.restype = ctypes.c_int
+
+    def keep_size_fallocate(fd, size):
+        if fallocate(fd, _FALLOC_FL_KEEP_SIZE, 0, size) != 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+    return keep_size_fallocate
+
+
+_fallocate = _load_fallocate()
+
 
 class CopyFile(HookClass):
     """
     Hook called when a file needs to be copied
     """
 
-    def execute(self, source_path, target_path, **kwargs):
+    # Files up to this size are copied with a single read and write.
+    SMALL_FILE_SIZE = 1024 * 1024
+    # Buffer used for the buffered copy, and the larger one used for files
+    # of LARGE_FILE_SIZE or more.
+    BUFFER_SIZE = 1024 * 1024
+    LARGE_BUFFER_SIZE = 8 * 1024 * 1024
+    LARGE_FILE_SIZE = 256 * 1024 * 1024
+    # Files of this size or more are preallocated before copying.
+    PREALLOCATE_SIZE = 16 * 1024 * 1024
+    # Bytes handed to the kernel per copy_file_range / sendfile call. This
+    # also sets how often progress is reported and cancellation is checked.
+    KERNEL_CHUNK_SIZE = 16 * 1024 * 1024
+
+    def execute(self, source_path, target_path, progress_callback=None, resume=False, link_mode="none",
+                check_existing=True, verify=False, **kwargs):
         """
         Main hook entry point
 
@@ -30,23 +118,452 @@ class CopyFile(HookClass):
 
         :target_path:   String
                         Target file path to copy to
+
+        :progress_callback: Callable
+                        Optional. Called with the number of bytes written after
+                        each chunk. It raises if the collection was cancelled.
+
+        :resume:        Boolean
+                        True if an interrupted collection left a partial copy of
+                        this exact source behind, which can be continued rather
+                        than started again.
+
+        :link_mode:     String
+                        One of "none", "reflink", "hardlink" or "auto". Unless it
+                        is "none", a source on the same device as the target is
+                        cloned (reflink) or hard linked instead of copied, "auto"
+                        trying a reflink first. Falls back to a copy whenever
+                        linking isn't possible.
+
+        :check_existing: Boolean
+                        If False the caller has already compared the source with
+                        any existing target and found it needs copying, so the
+                        hook doesn't stat both files again.
+
+        :verify:        Boolean
+                        If True the data is hashed as it is copied, and the
+                        finished copy is read back from the target and hashed
+                        again before it is moved into place. A mismatch raises
+                        IOError and leaves the target untouched.
+
+        :returns:       String or None
+                        With verify, the checksum of the copied data as
+                        "<algorithm>:<hex digest>". "up_to_date" if nothing was
+                        copied because check_existing found the target already
+                        matches the source. None if the file was linked, or
+                        copied without verify.
         """
         # Do some error catching:
+        if check_existing and self._is_unchanged(source_path, target_path):
+            return UP_TO_DATE
+        
+        # create the folder if it doesn't exist
+        dirname = os.path.dirname(target_path)
+        if not os.path.isdir(dirname):
+            failures = self._make_folders([dirname])
+            if failures:
+                raise failures[dirname]
+
+        return self._copy(source_path, target_path, progress_callback, resume, link_mode, verify)
+
+    def execute_batch(self, pairs, progress_callback=None, resume=(), link_mode="none", check_existing=True,
+                      verify=False, **kwargs):
+        """
+        Batch hook entry point, copies several files with a single hook call.
+        Every target folder the batch needs is created in one pass before any
+        file is copied, so a sequence checks and creates its folder once rather
+        than once per frame. Otherwise each file is copied as execute would.
+
+        :pairs:         List of (source_path, target_path) tuples
+                        Files to copy, in order.
+
+        :progress_callback: Callable
+                        As for execute, shared by every file. It is also called
+                        with 0 before each file, so a cancelled collection
+                        raises and fails the rest of the batch.
+
+        :resume:        Collection of strings
+                        Target paths whose partial copies can be resumed, see
+                        execute.
+
+        :link_mode:, :check_existing:, :verify:
+                        As for execute, for every file.
+
+        :returns:       List
+                        One entry per pair, in order: what execute returns for
+                        the file, or the exception raised copying it.
+        """
+        resume = set(resume)
+        folders = set(os.path.dirname(target_path) for source_path, target_path in pairs)
+        failures = self._make_folders([folder for folder in folders if not os.path.isdir(folder)])
+
+        results = []
+        for source_path, target_path in pairs:
+            if progress_callback:
+                progress_callback(0)
+            try:
+                folder_error = failures.get(os.path.dirname(target_path))
+                if folder_error is not None:
+                    raise folder_error
+                if check_existing and self._is_unchanged(source_path, target_path):
+                    results.append(UP_TO_DATE)
+                    continue
+                results.append(self._copy(source_path, target_path, progress_callback, target_path in resume,
+                                          link_mode, verify))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def _is_unchanged(self, source_path, target_path):
+        """
+        Returns True if target_path already exists with the same modification
+        time and size as source_path. The times only need to match to within
+        app.listing.MTIME_TOLERANCE, as copies don't always keep them exactly.
+        """
         if os.path.isfile(target_path):
-            if (os.path.getmtime(source_path) == os.path.getmtime(target_path)) and (os.path.getsize(source_path) == os.path.getsize(target_path)):
+            source_stat = os.stat(source_path)
+            target_stat = os.stat(target_path)
+            listing = self.parent.import_module("app").listing
+            if listing.is_unchanged_copy((source_stat.st_size, source_stat.st_mtime),
+                                         (target_stat.st_size, target_stat.st_mtime)):
                 # If the modified time and file size are both the same, the content
                 # is virtually guaranteed to be the same so we'll skip it.
                 
                 # We have artists who use both the network location and a mapped drive 
                 # for the same file location, so without getting too specific this makes
                 # it "safe enough" for my purposes.
-                return
-        
-        # create the folder if it doesn't exist
-        dirname = os.path.dirname(target_path)
-        if not os.path.isdir(dirname):
-            old_umask = os.umask(0)
-            os.makedirs(dirname, 0777)
-            os.umask(old_umask)
+                return True
+        return False
+
+    def _make_folders(self, folders):
+        """
+        Creates each of 'folders', along with any missing parent, and opens
+        up the permissions of every folder it created.
+
+        The umask is left alone: it's per process, and changing it would
+        affect every file the other copy threads, and the DCC itself, create
+        in the meantime.
+
+        :returns:   Dictionary mapping each folder that couldn't be created
+                    to the exception raised.
+        """
+        failures = {}
+        for folder in folders:
+            missing = []
+            parent = folder
+            while parent and not os.path.isdir(parent):
+                missing.append(parent)
+                if os.path.dirname(parent) == parent:
+                    break
+                parent = os.path.dirname(parent)
+            try:
+                os.makedirs(folder)
+            except OSError as e:
+                # another copy may have created it in the meantime
+                if e.errno != errno.EEXIST or not os.path.isdir(folder):
+                    failures[folder] = e
+                    continue
+            for created in reversed(missing):
+                try:
+                    os.chmod(created, 0o777)
+                except OSError:
+                    # created by another process, which sets it up itself
+                    pass
+        return failures
 
-        shutil.copy(source_path, target_path)
+    def _copy(self, source_path, target_path, progress_callback, resume, link_mode, verify):
+        """
+        Copies or links source_path to target_path, whose folder must
+        already exist. See execute for the arguments and return value.
+        """
+        # The data goes to a partial file that is only renamed to target_path
+        # once it is complete, so an interrupted copy can never pass for a
+        # finished one. If we're interrupted the partial file is left behind
+        # for the next run to resume.
+        partial_path = target_path + PARTIAL_SUFFIX
+        if link_mode != "none" and not resume and self._link(source_path, partial_path, link_mode):
+            self._move_into_place(partial_path, target_path)
+            return
+
+        hasher = None
+        if verify:
+            algorithm, hash_constructor = _hash_algorithm()
+            hasher = hash_constructor()
+        self._copy_data(source_path, partial_path, progress_callback, resume, hasher)
+        checksum = None
+        if hasher is not None:
+            checksum = "%s:%s" % (algorithm, hasher.hexdigest())
+            target_hasher = hash_constructor()
+            self._hash_target(partial_path, target_hasher)
+            if target_hasher.hexdigest() != hasher.hexdigest():
+                # don't leave a corrupt partial file behind to be resumed
+                os.remove(partial_path)
+                raise IOError("Checksum mismatch copying '%s' to '%s', the copy was discarded."
+                              % (source_path, target_path))
+
+        # copystat keeps the modification time, which is what lets
+        # _is_unchanged skip this file the next time round.
+        shutil.copystat(source_path, partial_path)
+        self._move_into_place(partial_path, target_path)
+        return checksum
+
+    def _move_into_place(self, partial_path, target_path):
+        """
+        Renames the finished partial file to the target, replacing any
+        existing file.
+        """
+        if hasattr(os, "replace"):
+            os.replace(partial_path, target_path)
+        else:
+            if os.name == "nt" and os.path.exists(target_path):
+                # os.rename won't replace an existing file on Windows
+                os.remove(target_path)
+            os.rename(partial_path, target_path)
+
+    def _link(self, source_path, partial_path, link_mode):
+        """
+        Tries to create partial_path as a reflink or hard link of source_path.
+
+        :returns:   True if a link was made, False if the files are on
+                    different devices or the filesystem doesn't support the
+                    requested kind of link.
+        """
+        try:
+            same_device = os.stat(source_path).st_dev == os.stat(os.path.dirname(partial_path)).st_dev
+        except OSError:
+            return False
+        if not same_device:
+            return False
+
+        if os.path.lexists(partial_path):
+            os.remove(partial_path)
+
+        if link_mode in ("reflink", "auto") and self._reflink(source_path, partial_path):
+            shutil.copystat(source_path, partial_path)
+            return True
+
+        if link_mode in ("hardlink", "auto") and hasattr(os, "link"):
+            # A hard link is the source file itself, so there is nothing to
+            # copy the stat from, but any later change to one changes both.
+            try:
+                os.link(source_path, partial_path)
+                return True
+            except OSError:
+                pass
+        return False
+
+    def _reflink(self, source_path, partial_path):
+        """
+        Clones source_path to partial_path on a copy-on-write filesystem
+        (Btrfs, XFS, ZFS on Linux; APFS on macOS). The clone shares the
+        source's data blocks until either file is modified.
+
+        :returns:   True if the clone was made.
+        """
+        if sys.platform.startswith("linux"):
+            try:
+                import fcntl
+            except ImportError:
+                return False
+            try:
+                with open(source_path, "rb") as source_file:
+                    with open(partial_path, "wb") as target_file:
+                        fcntl.ioctl(target_file.fileno(), _FICLONE, source_file.fileno())
+                return True
+            except (IOError, OSError):
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+                return False
+
+        if sys.platform == "darwin":
+            try:
+                import ctypes
+                import ctypes.util
+                libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+                clonefile = libc.clonefile
+            except (OSError, AttributeError):
+                return False
+            encoding = sys.getfilesystemencoding()
+            if not isinstance(source_path, bytes):
+                source_path = source_path.encode(encoding)
+            if not isinstance(partial_path, bytes):
+                partial_path = partial_path.encode(encoding)
+            return clonefile(source_path, partial_path, 0) == 0
+
+        return False
+
+    def _copy_data(self, source_path, partial_path, progress_callback, resume, hasher=None):
+        """
+        Copies the contents of source_path to partial_path, appending to what
+        is already there if resume is True.
+
+        Small files are copied with a single read and write. Larger ones are
+        preallocated and then copied in the kernel where the platform allows
+        it, falling back to a buffered copy with a large reusable buffer.
+
+        If 'hasher' is given every byte of the source is fed into it. The data
+        then has to pass through user space, so the kernel copy isn't used.
+        """
+        size = os.path.getsize(source_path)
+        offset = 0
+        if resume and os.path.isfile(partial_path):
+            # The size of the partial file is how far the last copy got, as
+            # preallocating doesn't change it. A partial file as large as the
+            # source may have been preallocated by an older version of this
+            # hook, so it is copied again rather than trusted.
+            offset = os.path.getsize(partial_path)
+            if offset >= size:
+                offset = 0
+
+        with io.open(source_path, "rb", buffering=0) as source_file:
+            with io.open(partial_path, "r+b" if offset else "wb", buffering=0) as target_file:
+                if hasher is not None and offset:
+                    # the part copied by an earlier run is hashed from the
+                    # source, the only part of it that is read twice
+                    self._hash_range(source_file, offset, hasher)
+                if size - offset <= self.SMALL_FILE_SIZE:
+                    source_file.seek(offset)
+                    target_file.seek(offset)
+                    data = source_file.read()
+                    if hasher is not None:
+                        hasher.update(data)
+                    self._write_all(target_file, memoryview(data))
+                    target_file.truncate()
+                    if progress_callback:
+                        progress_callback(len(data))
+                    return
+
+                if not offset:
+                    self._preallocate(target_file, size)
+                if hasher is None and self._copy_in_kernel(source_file, target_file, offset, size,
+                                                           progress_callback):
+                    return
+                self._copy_buffered(source_file, target_file, offset, size, progress_callback, hasher)
+
+    def _preallocate(self, target_file, size):
+        """
+        Reserves the full size of the target up front where the filesystem
+        supports it, which reduces fragmentation and fails early when the
+        target is out of space. A no-op everywhere else.
+
+        The file keeps its size while the space is reserved, so an
+        interrupted copy leaves a partial file only as large as what was
+        actually written, for the next run to resume from.
+        """
+        if _fallocate is None or size < self.PREALLOCATE_SIZE:
+            return
+        try:
+            _fallocate(target_file.fileno(), size)
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+            # not supported by this filesystem (e.g. some NFS servers)
+
+    def _copy_in_kernel(self, source_file, target_file, offset, size, progress_callback):
+        """
+        Copies the data without passing it through user space, using
+        copy_file_range or sendfile. Both are Linux only (and copy_file_range
+        also lets NFS 4.2 and CIFS servers copy on the server side).
+
+        :returns:   True if the data was copied, False if neither call is
+                    available or supported between these two files, in which
+                    case nothing has been written.
+        """
+        for name in ("copy_file_range", "sendfile"):
+            func = getattr(os, name, None)
+            if func is None:
+                continue
+
+            source_fd = source_file.fileno()
+            target_fd = target_file.fileno()
+            position = offset
+            while position < size:
+                count = min(self.KERNEL_CHUNK_SIZE, size - position)
+                try:
+                    if name == "copy_file_range":
+                        written = func(source_fd, target_fd, count, position, position)
+                    else:
+                        os.lseek(target_fd, position, os.SEEK_SET)
+                        written = func(target_fd, source_fd, position, count)
+                except OSError as e:
+                    if position == offset and e.errno in _UNSUPPORTED_ERRNOS:
+                        # try the next method
+                        break
+                    raise
+                if written == 0:
+                    # the source was truncated while we were copying it
+                    raise IOError("Unexpected end of file copying '%s'." % source_file.name)
+                position += written
+                if progress_callback:
+                    progress_callback(written)
+            else:
+                os.ftruncate(target_fd, size)
+                return True
+        return False
+
+    def _copy_buffered(self, source_file, target_file, offset, size, progress_callback, hasher=None):
+        """
+        Copies the data through one reusable buffer, sized to the file,
+        feeding it into 'hasher' if given.
+        """
+        buffer_size = self.BUFFER_SIZE
+        if size >= self.LARGE_FILE_SIZE:
+            buffer_size = self.LARGE_BUFFER_SIZE
+        buf = bytearray(buffer_size)
+        view = memoryview(buf)
+
+        source_file.seek(offset)
+        target_file.seek(offset)
+        while True:
+            count = source_file.readinto(buf)
+            if not count:
+                break
+            if hasher is not None:
+                hasher.update(view[:count])
+            self._write_all(target_file, view[:count])
+            if progress_callback:
+                progress_callback(count)
+        target_file.truncate()
+
+    def _write_all(self, target_file, view):
+        """
+        Writes all of 'view' to an unbuffered file, which may take more than
+        one write call.
+        """
+        while len(view):
+            written = target_file.write(view)
+            view = view[written:]
+
+    def _hash_range(self, source_file, size, hasher):
+        """
+        Feeds the first 'size' bytes of an open file into 'hasher'.
+        """
+        source_file.seek(0)
+        left = size
+        while left:
+            data = source_file.read(min(self.BUFFER_SIZE, left))
+            if not data:
+                raise IOError("Unexpected end of file hashing '%s'." % source_file.name)
+            hasher.update(data)
+            left -= len(data)
+
+    def _hash_target(self, partial_path, hasher):
+        """
+        Reads a finished copy back through a memory map and feeds it into
+        'hasher'. The copy is flushed to storage first, and on Linux dropped
+        from the page cache, so what is read back is what was actually
+        written rather than what is still in memory.
+        """
+        with io.open(partial_path, "r+b", buffering=0) as target_file:
+            fd = target_file.fileno()
+            os.fsync(fd)
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            if not os.fstat(fd).st_size:
+                # an empty file can't be mapped, and hashes as nothing
+                return
+            mapped = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+            try:
+                hasher.update(mapped)
+            finally:
+                mapped.close()
@@ -0,0 +1,53 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+# 
+# CONFIDENTIAL AND PROPRIETARY
+# 
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit 
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your 
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights 
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import sgtk
+
+HookClass = sgtk.get_hook_baseclass()
+
+
+class LogMetrics(HookClass):
+    """
+    Hook called with the metrics of every collection
+    """
+    
+    def execute(self, report, report_path, **kwargs):
+        """
+        Main hook entry point. The default implementation logs a summary to
+        the Toolkit log; override it to send the report elsewhere.
+        
+        :report:        Dictionary with the metrics of the collection:
+                        {
+                            phases:         Seconds spent in scan, plan, copy
+                                            and update
+                            files:          Number of files copied, up_to_date,
+                                            declined and failed
+                            bytes:          Bytes copied, up_to_date and declined
+                            latency:        Per file copy time percentiles
+                            source_volumes: Files, bytes and throughput per
+                                            source volume
+                            failures:       Source, target and exception of each
+                                            file that failed to copy
+                            object_errors:  Error message of each scene object
+                                            that couldn't be collected
+                            ...
+                        }
+        :report_path:   Path the report was written to as JSON, or None if it
+                        couldn't be written.
+        """
+        phases = ", ".join("%s %.2fs" % (name, seconds) for name, seconds in sorted(report["phases"].items()))
+        self.parent.log_info("Collected %d files (%d bytes), %d up to date, %d failed. %s"
+                             % (report["files"]["copied"], report["bytes"]["copied"],
+                                report["files"]["up_to_date"], report["files"]["failed"], phases))
+        for failure in report["failures"]:
+            self.parent.log_debug("Failed to copy %s to %s:\n%s"
+                                  % (failure["source"], failure["target"], failure["traceback"]))
+        if report_path:
+            self.parent.log_debug("Collection report written to %s" % report_path)
@@ -0,0 +1,274 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import io
+import sys
+import time
+import tarfile
+import zipfile
+import threading
+import collections
+import sgtk
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+HookClass = sgtk.get_hook_baseclass()
+
+# Appended to the archive path while the archive is being written.
+PARTIAL_SUFFIX = ".partial"
+
+
+class PackageFiles(HookClass):
+    """
+    Hook called to write collected files into a single archive, instead of
+    copying them one by one with hook_copy_file
+    """
+
+    # Files up to this size are read ahead on several threads while earlier
+    # files are written, larger ones are streamed straight into the archive.
+    SMALL_FILE_SIZE = 1024 * 1024
+    # Maximum number of files read ahead of the one being written.
+    READ_AHEAD = 64
+    # Chunk size for streaming large files, which also sets how often
+    # progress is reported.
+    BUFFER_SIZE = 8 * 1024 * 1024
+
+    def execute(self, archive_path, files, archive_format="tar", compression="none", progress_callback=None,
+                read_threads=4, **kwargs):
+        """
+        Main hook entry point
+
+        :archive_path:  String
+                        Path of the archive to write. Any existing archive is
+                        replaced once the new one is complete.
+
+        :files:         List of (source_path, name) tuples
+                        Files to put in the archive, and the relative path
+                        each one is stored under. Written in this order.
+
+        :archive_format: String
+                        "tar" or "zip".
+
+        :compression:   String
+                        "none" to store the files as they are, or "fast" for
+                        the lightest gzip/deflate compression.
+
+        :progress_callback: Callable
+                        Optional. Called with the number of bytes written after
+                        each chunk. It raises if the packaging was cancelled.
+
+        :read_threads:  Integer
+                        Number of threads reading small files ahead of the
+                        writer, which hides the latency of opening many small
+                        files on network storage.
+
+        :returns:       Dictionary
+                        Maps each source path that couldn't be read to the
+                        error message. Those files are left out of the archive.
+                        A file that fails part way through being written fails
+                        the whole archive instead, as it can't be taken out
+                        again.
+        """
+        failures = {}
+        partial_path = archive_path + PARTIAL_SUFFIX
+        folder = os.path.dirname(archive_path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        writer = self._open(partial_path, archive_format, compression)
+        try:
+            for source, name, stat, data, error in self._read_ahead(files, read_threads):
+                if data is not None:
+                    writer.add_data(name, stat, data, progress_callback)
+                    continue
+                if error is None:
+                    try:
+                        source_file = io.open(source, "rb")
+                    except (IOError, OSError) as e:
+                        error = e
+                if error is not None:
+                    failures[source] = "%s: %s" % (type(error).__name__, error)
+                    continue
+                with source_file:
+                    writer.add_file(name, stat, source_file, progress_callback)
+        except Exception:
+            writer.close()
+            os.remove(partial_path)
+            raise
+        writer.close()
+
+        if os.path.exists(archive_path):
+            # os.rename won't replace an existing file on Windows
+            os.remove(archive_path)
+        os.rename(partial_path, archive_path)
+        return failures
+
+    def _open(self, path, archive_format, compression):
+        """
+        Returns a writer for a new archive at 'path'.
+        """
+        if archive_format == "zip":
+            return _ZipWriter(path, compression, self.BUFFER_SIZE)
+        if archive_format == "tar":
+            return _TarWriter(path, compression)
+        raise ValueError("Unknown archive format '%s'." % archive_format)
+
+    def _read_ahead(self, files, read_threads):
+        """
+        Yields a (source_path, name, stat, data, error) tuple for each file,
+        in order. Small files are read on 'read_threads' threads, up to
+        READ_AHEAD files ahead, and come with their data; large files come
+        with data None, to be streamed by the writer. error is the exception
+        raised reading the file, if any.
+        """
+        work = queue.Queue()
+        window = collections.deque()
+
+        def reader():
+            while True:
+                slot = work.get()
+                if slot is None:
+                    return
+                try:
+                    slot["stat"] = os.stat(slot["source"])
+                    if slot["stat"].st_size <= self.SMALL_FILE_SIZE:
+                        with io.open(slot["source"], "rb") as source_file:
+                            slot["data"] = source_file.read()
+                except (IOError, OSError) as e:
+                    slot["error"] = e
+                finally:
+                    slot["ready"].set()
+
+        threads = []
+        for i in range(max(1, read_threads)):
+            thread = threading.Thread(target=reader)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        def take():
+            slot = window.popleft()
+            slot["ready"].wait()
+            return slot["source"], slot["name"], slot["stat"], slot["data"], slot["error"]
+
+        try:
+            for source, name in files:
+                slot = {"source": source, "name": name, "stat": None, "data": None, "error": None,
+                        "ready": threading.Event()}
+                work.put(slot)
+                window.append(slot)
+                if len(window) >= self.READ_AHEAD:
+                    yield take()
+            while window:
+                yield take()
+        finally:
+            for thread in threads:
+                work.put(None)
+
+
+class _TarWriter(object):
+    """
+    Adds files to a tar archive, gzipped at the lowest level for "fast".
+    """
+
+    def __init__(self, path, compression):
+        if compression == "fast":
+            self._tar = tarfile.open(path, "w:gz", compresslevel=1)
+        else:
+            self._tar = tarfile.open(path, "w")
+
+    def add_data(self, name, stat, data, progress_callback):
+        info = self._info(name, stat)
+        info.size = len(data)
+        self._tar.addfile(info, io.BytesIO(data))
+        if progress_callback:
+            progress_callback(len(data))
+
+    def add_file(self, name, stat, source_file, progress_callback):
+        self._tar.addfile(self._info(name, stat), _ProgressReader(source_file, progress_callback))
+
+    def _info(self, name, stat):
+        info = tarfile.TarInfo(name)
+        info.size = stat.st_size
+        info.mtime = stat.st_mtime
+        info.mode = stat.st_mode & 0o7777
+        return info
+
+    def close(self):
+        self._tar.close()
+
+
+class _ZipWriter(object):
+    """
+    Adds files to a zip archive, deflated at the lowest level for "fast".
+    """
+
+    def __init__(self, path, compression, buffer_size):
+        method = zipfile.ZIP_DEFLATED if compression == "fast" else zipfile.ZIP_STORED
+        try:
+            self._zip = zipfile.ZipFile(path, "w", method, allowZip64=True, compresslevel=1)
+        except TypeError:
+            # compresslevel is Python 3.7+, older versions deflate at the default level
+            self._zip = zipfile.ZipFile(path, "w", method, allowZip64=True)
+        self._method = method
+        self._buffer_size = buffer_size
+
+    def add_data(self, name, stat, data, progress_callback):
+        self._zip.writestr(self._info(name, stat), data)
+        if progress_callback:
+            progress_callback(len(data))
+
+    def add_file(self, name, stat, source_file, progress_callback):
+        if sys.version_info < (3, 6):
+            # older versions can't stream into a zip entry
+            self._zip.write(source_file.name, name, self._method)
+            if progress_callback:
+                progress_callback(stat.st_size)
+            return
+        info = self._info(name, stat)
+        info.file_size = stat.st_size
+        with self._zip.open(info, "w", force_zip64=True) as entry:
+            while True:
+                chunk = source_file.read(self._buffer_size)
+                if not chunk:
+                    break
+                entry.write(chunk)
+                if progress_callback:
+                    progress_callback(len(chunk))
+
+    def _info(self, name, stat):
+        # zip can't store dates before 1980
+        info = zipfile.ZipInfo(name, time.localtime(max(stat.st_mtime, 315532800))[:6])
+        info.compress_type = self._method
+        info.external_attr = (stat.st_mode & 0xFFFF) << 16
+        return info
+
+    def close(self):
+        self._zip.close()
+
+
+class _ProgressReader(object):
+    """
+    File wrapper reporting the bytes read from it to a progress callback.
+    """
+
+    def __init__(self, source_file, progress_callback):
+        self._file = source_file
+        self._progress_callback = progress_callback
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        if self._progress_callback and data:
+            self._progress_callback(len(data))
+        return data
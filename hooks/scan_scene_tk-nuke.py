@@ -9,8 +9,6 @@
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
 import os
-import glob
-import re
 
 import sgtk
 from sgtk import TankError
@@ -25,6 +23,17 @@ class ScanSceneHook(hook):
     Hook to scan scene for external files to copy
     """
     
+    # Registry of the scene_item_types the Nuke scan handles, mapping each to
+    # the name of the method that builds the task for a Read node of that
+    # type. Derived hooks can add their own types here.
+    READ_NODE_HANDLERS = {"read_node_sequence": "_read_node_sequence",
+                          "read_node_movie": "_read_node_movie",
+                          "read_node_still": "_read_node_still",
+                          }
+    
+    # Nuke Studio / Hiero types that the Nuke scan ignores.
+    IGNORED_TYPES = ("clip_source", "nuke_script")
+    
     #def execute(self, app_instance, **kwargs):
     def execute(self, **kwargs):
         """
@@ -35,7 +44,9 @@ class ScanSceneHook(hook):
                     tasks:              list
                                         A list of any items that were found that need to be copied into 
                                         the project. Each item in the list should be a dictionary 
-                                        containing the following keys:
+                                        (or an app.tasks.CollectionTask, which behaves as one, with
+                                        the files of a sequence as a SequenceFiles) containing the
+                                        following keys:
                                         {
                                             type:   String
                                                     This should match a scene_item_type defined in
@@ -64,7 +75,39 @@ class ScanSceneHook(hook):
             return self._studio_execute()
         else:
             return self._nuke_execute()
+    
+    def execute_streaming(self, counters, **kwargs):
+        """
+        Streaming version of execute, so files can be copied while the rest
+        of the scene is still being scanned.
+        
+        :counters:  Dictionary in which 'references_scanned' is kept up to
+                    date as the scan goes.
+        
+        :returns:   Iterable of the same tasks execute would return, yielded
+                    one at a time as the Read nodes are scanned.
+        """
+        engine = self.parent.engine
+        own_execute = getattr(ScanSceneHook.execute, "__func__", ScanSceneHook.execute)
+        if (getattr(engine, "hiero_enabled", False) or getattr(engine, "studio_enabled", False)
+                or getattr(type(self).execute, "__func__", type(self).execute) is not own_execute):
+            # Hiero scans, and derived hooks that only override execute, don't
+            # stream: hand back everything execute finds in one go.
+            references_scanned, tasks = self.execute(**kwargs)
+            counters["references_scanned"] = references_scanned
+            return iter(tasks)
+        return self._nuke_stream(counters)
             
+    def scene_path(self, **kwargs):
+        """
+        Returns the path of the current Nuke script, or None if it hasn't
+        been saved yet.
+        """
+        path = nuke.root().name()
+        if not path or path == "Root":
+            return None
+        return path
+    
     def _studio_execute(self):
         """
         The Nuke Studio-specific scan_scene routine.
@@ -102,241 +145,207 @@ class ScanSceneHook(hook):
         """
         The Nuke-specific scan_scene routine.
         """
+        counters = {"references_scanned": 0}
+        tasks = list(self._nuke_stream(counters))
+        
+        print "DEBUG INFO: ",
+        for task in tasks:
+            print task['name'],
+        print "\n"
+        return counters["references_scanned"], tasks
+    
+    def _nuke_stream(self, counters):
+        """
+        Generator behind the Nuke scan.
+        
+        Walks the node graph once, including inside Groups, reads the file knob
+        of every Read node once and hands the node to the handler of each
+        configured scene_item_type whose extensions match, yielding each task
+        as soon as it's built.
+        """
         
         #Declare some stuff we will need:
         
         engine = self.parent.engine
         types = self.parent.get_setting("scene_item_types")
-        project_path = engine.sgtk.project_path.replace("\\","/")
+        app = self.parent.import_module("app")
         
-        references_scanned = 0
-        tasks = []
+        scan = _NukeScan()
+        # Built once per scan from every storage root and configured alias of
+        # the project, so files reached through another mount aren't copied.
+        scan.containment = app.containment.ProjectContainment.from_tk(engine.sgtk,
+                                                                      self.parent.get_setting("project_path_aliases"))
+        scan.sequences = app.sequences
+        # Every folder we look in is only listed once per scan, however many
+        # nodes read from it.
+        scan.directory_cache = app.listing.DirectoryCache()
+        scan.respect_frame_range = self.parent.get_setting("respect_frame_range")
+        scan.frame_range_handles = self.parent.get_setting("frame_range_handles")
+        scan.context = engine.context
+        scan.resolver = app.resolver.TemplateResolver()
+        scan.parse_version = app.resolver.parse_version
+        scan.task_class = app.tasks.CollectionTask
         
-        # iterate through scene_item_types from config:
+        # Look up the handler and template for each of the configured types
+        # once, rather than once per node.
+        handlers = []
         for type in types:
+            if type["type"] in self.IGNORED_TYPES:
+                continue
+            if type["type"] not in self.READ_NODE_HANDLERS:
+                raise TankError("Item type '"+type["type"]+" in configuration is not supported by hook!")
             destination_path_template = engine.sgtk.templates[type["destination_path_template"]]
-            
-            all_nodes = nuke.allNodes()
-            
-            # We're processing the read nodes three times based on content, because
-            
-            if type["type"] == "read_node_sequence":
-                # For read nodes, we go through all read node objects, see if their path is inside 
-                # the project path. If not, we must determine if it is a sequence before listing all the 
-                # files we need.
-                
-                read_nodes = [node for node in all_nodes if 'Read' in node['name'].value()]
-                
-                if len(read_nodes) == 0:
-                    print "tk-multi-collectfiles found no read nodes to process."
-                    continue
-                
-                fields = engine.context.as_template_fields(destination_path_template)
-                
-                for node in read_nodes:
-                    filename = node['file'].value()
-                    ext = os.path.splitext(filename)[1].lower()
-                    # Make sure the file is a type we care about:
-                    if ext not in type["extensions"]:
-                        continue
-                    
-                    source_path,file = os.path.split(filename)
-                    
-                    # Then determine if it is a sequence:
-                    if file.find("%") != -1:
-                        sequence_name = file.split("%")[0]
-                        sequence_ext = file.split(re.search('%[0-9]{2}d',file).group(0))[1]
-                        is_sequence = True
-                    else:
-                        is_sequence = False
-                        continue
-                    
-                    # Now that we're sure this is the right type, we can increment the counter.
-                    references_scanned += 1
-                    
-                    # Next determine if the file is inside the project:
-                    if not os.path.isabs(filename):
-                        # Relative paths should always be inside the project.
-                        continue
-                    if filename.startswith(project_path):
-                        continue
-                    
-                                        
-                    # Now we get the rest of the stuff we may need for our template
-                    version_search = re.search('_v[0-9]{2,5}',filename)
-                    if version_search:
-                        version = int(version_search.group(0)[2:])
-                        fields['pass'] = file.split(version_search.group(0))[0]
-                    else:
-                        version = 1
-                        fields['pass'] = sequence_name.rstrip('.')
-                    
-                    fields['version'] = version
-                    
-                    target_path = destination_path_template.apply_fields(fields)
-                    
-                    # Now we build the lists of source and target filenames:
-                        
-                    if is_sequence:
-                        source_files = glob.glob(os.path.join(source_path,sequence_name+"*"+sequence_ext))
-                        target_files = [os.path.join(target_path,os.path.split(source_file)[1]) for source_file in source_files]
-                        new_filename = os.path.join(target_path,file)
-                    else:
-                        new_filename = os.path.join(target_path,file)
-                        source_files = [filename]
-                        target_files = [new_filename]
-                        
-                    
-                    tasks += [{ "type": "read_node_sequence",
-                                "name": node['name'].value(),
-                                "source_files":source_files,
-                                "target_files":target_files,
-                                "error":False,
-                                "other_params":{"new_filename":new_filename,
-                                    "task_object":node
-                                    }
-                                }]
-            elif type["type"] == "read_node_movie":
-                # For read nodes, we go through all read node objects, see if their path is inside 
-                # the project path. If not, we must determine if it is a sequence before listing all the 
-                # files we need.
-                
-                read_nodes = [node for node in all_nodes if 'Read' in node['name'].value()]
-                
-                if len(read_nodes) == 0:
-                    print "tk-multi-collectfiles found no read nodes to process."
-                    continue
-                
-                fields = engine.context.as_template_fields(destination_path_template)
-                
-                for node in read_nodes:
-                    
-                    filename = node['file'].value()
-                    ext = os.path.splitext(filename)[1].lower()
-                    # Make sure the file is a type we care about:
-                    if ext not in type["extensions"]:
-                        continue
-                    
-                    # Now that we're sure this is the right type, we can increment the counter.
-                    references_scanned += 1
-                    
-                    
-                    # Next determine if the file is inside the project:
-                    if not os.path.isabs(filename):
-                        # Relative paths should always be inside the project.
-                        continue
-                    if filename.startswith(project_path):
-                        continue
-                    
-                    source_path,file = os.path.split(filename)
-                    
-                      
-                    # Now we get the rest of the stuff we may need for our template
-                    version_search = re.search('_v[0-9]{2,5}',filename)
-                    if version_search:
-                        version = int(version_search.group(0)[2:])
-                        fields['pass'] = file.split(version_search.group(0))[0]
-                    else:
-                        version = 1
-                        fields['pass'] = sequence_name.rstrip('.')
-                    
-                    fields['version'] = version
-                                        
-                    target_path = destination_path_template.apply_fields(fields)
-                    
-                    # Now we build the lists of source and target filenames:
-                        
-                    new_filename = os.path.join(target_path,file)
-                    source_files = [filename]
-                    target_files = [new_filename]
-                        
-                    
-                    tasks += [{ "type": "read_node_movie",
-                                "name": node['name'].value(),
-                                "source_files":source_files,
-                                "target_files":target_files,
-                                "error":False,
-                                "other_params":{"new_filename":new_filename,
-                                    "task_object":node
-                                    }
-                                }]
-            elif type["type"] == "read_node_still":
-                # For read nodes, we go through all read node objects, see if their path is inside 
-                # the project path. If not, we must determine if it is a sequence before listing all the 
-                # files we need.
-                
-                read_nodes = [node for node in all_nodes if 'Read' in node['name'].value()]
-                
-                if len(read_nodes) == 0:
-                    print "tk-multi-collectfiles found no read nodes to process."
+            handler = getattr(self, self.READ_NODE_HANDLERS[type["type"]])
+            handlers.append((type, destination_path_template, handler))
+        
+        read_nodes = nuke.allNodes("Read", recurseGroups=True)
+        if len(read_nodes) == 0:
+            print "tk-multi-collectfiles found no read nodes to process."
+            return
+        
+        for node in read_nodes:
+            reference = _ReadReference(node, scan.sequences)
+            for type, destination_path_template, handler in handlers:
+                # Make sure the file is a type we care about:
+                if reference.ext not in type["extensions"]:
                     continue
-                
-                fields = engine.context.as_template_fields(destination_path_template)
-                
-                for node in read_nodes:
-                    
-                    filename = node['file'].value()
-                    ext = os.path.splitext(filename)[1].lower()
-                    # Make sure the file is a type we care about:
-                    if ext not in type["extensions"]:
-                        continue
-                    
-                    source_path,file = os.path.split(filename)
-                    
-                    # Then determine if it is a sequence:
-                    if file.find("%") != -1:
-                        continue
-                    
-                    # Now that we're sure this is the right type, we can increment the counter.
-                    references_scanned += 1
-                    
-                    # Next determine if the file is inside the project:
-                    if not os.path.isabs(filename):
-                        # Relative paths should always be inside the project.
-                        continue
-                    
-                    if filename.startswith(project_path):
-                        continue
-                    
-                    
-                    # Now we get the rest of the stuff we may need for our template
-                    version_search = re.search('_v[0-9]{2,5}',filename)
-                    if version_search:
-                        version = int(version_search.group(0)[2:])
-                    else:
-                        version = 1
-                    
-                    fields['version'] = version
-                    
-                    target_path = destination_path_template.apply_fields(fields)
-                    
-                    # Now we build the lists of source and target filenames:
-                        
-                    new_filename = os.path.join(target_path,file)
-                    source_files = [filename]
-                    target_files = [new_filename]
-                        
-                    
-                    tasks += [{ "type": "read_node_still",
-                                "name": node['name'].value(),
-                                "source_files":source_files,
-                                "target_files":target_files,
-                                "error":False,
-                                "other_params":{"new_filename":new_filename,
-                                    "task_object":node
-                                    }
-                                }]
-            elif type["type"] == "clip_source":
-                #Nuke Studio / Hiero thing
-                pass
-            elif type["type"] == "nuke_script":
-                #Nuke Studio / Hiero thing
-                # To-do
-                pass
-            else:
-                raise TankError("Item type '"+type["type"]+" in configuration is not supported by hook!")
-            print "DEBUG INFO: ",
-            for task in tasks:
-                print task['name'],
-            print "\n"
-        return references_scanned, tasks
\ No newline at end of file
+                task = handler(reference, type, destination_path_template, scan)
+                counters["references_scanned"] = scan.references_scanned
+                if task:
+                    yield task
+    
+    def _read_node_sequence(self, reference, type, destination_path_template, scan):
+        """
+        Handler for read_node_sequence, builds a task for a Read node that reads
+        an image sequence.
+        
+        :returns:   Task dictionary, or None if the node doesn't read a sequence
+                    or doesn't need collecting.
+        """
+        sequence = reference.sequence
+        if not sequence:
+            return None
+        
+        # Now that we're sure this is the right type, we can increment the counter.
+        scan.references_scanned += 1
+        if not self._is_external(reference, scan):
+            return None
+        
+        target_path = self._target_path(reference, destination_path_template, scan, sequence.prefix.rstrip('.'))
+        
+        # Now we build the lists of source and target filenames, kept as a
+        # folder, pattern and frame numbers rather than as lists of paths:
+        source_files = sequence.files(reference.folder, scan.directory_cache, self._frames_used(reference.node, scan))
+        target_files = source_files.with_folder(target_path)
+        new_filename = os.path.join(target_path,reference.file)
+        return self._task(type["type"], reference, source_files, target_files, new_filename, scan)
+    
+    def _read_node_movie(self, reference, type, destination_path_template, scan):
+        """
+        Handler for read_node_movie, builds a task for a Read node that reads a
+        single movie file.
+        
+        :returns:   Task dictionary, or None if the node doesn't need collecting.
+        """
+        # Now that we're sure this is the right type, we can increment the counter.
+        scan.references_scanned += 1
+        if not self._is_external(reference, scan):
+            return None
+        
+        target_path = self._target_path(reference, destination_path_template, scan,
+                                        os.path.splitext(reference.file)[0])
+        new_filename = os.path.join(target_path,reference.file)
+        return self._task(type["type"], reference, [reference.filename], [new_filename], new_filename, scan)
+    
+    def _read_node_still(self, reference, type, destination_path_template, scan):
+        """
+        Handler for read_node_still, builds a task for a Read node that reads a
+        single image.
+        
+        :returns:   Task dictionary, or None if the node reads a sequence or
+                    doesn't need collecting.
+        """
+        if reference.sequence:
+            return None
+        
+        # Now that we're sure this is the right type, we can increment the counter.
+        scan.references_scanned += 1
+        if not self._is_external(reference, scan):
+            return None
+        
+        target_path = self._target_path(reference, destination_path_template, scan,
+                                        os.path.splitext(reference.file)[0])
+        new_filename = os.path.join(target_path,reference.file)
+        return self._task(type["type"], reference, [reference.filename], [new_filename], new_filename, scan)
+    
+    def _is_external(self, reference, scan):
+        """
+        Returns True if the file a node reads lives outside the project.
+        """
+        if not os.path.isabs(reference.filename):
+            # Relative paths should always be inside the project.
+            return False
+        return not scan.containment.contains(reference.filename)
+    
+    def _target_path(self, reference, destination_path_template, scan, default_pass):
+        """
+        Returns the folder a node's files should be collected into.
+        
+        :default_pass:  Value for the 'pass' field when the file name doesn't
+                        contain a version.
+        """
+        # Now we get the rest of the stuff we may need for our template
+        pass_name, version = scan.parse_version(reference.filename, default_pass)
+        return scan.resolver.apply(scan.context, destination_path_template, pass_name, version)
+    
+    def _task(self, type_name, reference, source_files, target_files, new_filename, scan):
+        """
+        Returns the task for a node.
+        """
+        return scan.task_class(type_name, reference.name, source_files, target_files,
+                               other_params={"new_filename":new_filename,
+                                             "task_object":reference.node
+                                             })
+    
+    def _frames_used(self, node, scan):
+        """
+        Returns the set of frames a Read node actually reads, padded by the
+        configured handles, or None to collect every frame on disk.
+        """
+        if not scan.respect_frame_range:
+            return None
+        first = int(node['first'].value()) - scan.frame_range_handles
+        last = int(node['last'].value()) + scan.frame_range_handles
+        return set(range(first, last + 1))
+
+
+class _NukeScan(object):
+    """
+    State shared by the handlers during one scan of the Nuke script.
+    """
+    def __init__(self):
+        self.references_scanned = 0
+        self.containment = None
+        self.sequences = None
+        self.directory_cache = None
+        self.respect_frame_range = False
+        self.frame_range_handles = 0
+        self.context = None
+        self.resolver = None
+        self.parse_version = None
+        self.task_class = None
+
+
+class _ReadReference(object):
+    """
+    The knob values of a Read node that the handlers need, read once.
+    """
+    __slots__ = ("node", "name", "filename", "folder", "file", "ext", "sequence")
+    
+    def __init__(self, node, sequences):
+        self.node = node
+        self.name = node.fullName()
+        self.filename = node['file'].value()
+        self.folder, self.file = os.path.split(self.filename)
+        self.ext = os.path.splitext(self.filename)[1].lower()
+        self.sequence = sequences.parse_pattern(self.file)
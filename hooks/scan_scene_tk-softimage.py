@@ -9,7 +9,6 @@
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
 import os
-import glob
 
 import sgtk
 from sgtk import TankError
@@ -39,7 +38,9 @@ class ScanSceneHook(hook):
                     tasks:              list
                                         A list of any items that were found that need to be copied into 
                                         the project. Each item in the list should be a dictionary 
-                                        containing the following keys:
+                                        (or an app.tasks.CollectionTask, which behaves as one, with
+                                        the files of a sequence as a SequenceFiles) containing the
+                                        following keys:
                                         {
                                             type:   String
                                                     This should match a scene_item_type defined in
@@ -65,6 +66,16 @@ class ScanSceneHook(hook):
         #Declare some more stuff we will need:
         engine = sgtk.platform.current_engine()
         types = self.parent.get_setting("scene_item_types")
+        app = self.parent.import_module("app")
+        resolver = app.resolver.TemplateResolver()
+        # Built once per scan from every storage root and configured alias of
+        # the project, so files reached through another mount aren't copied.
+        containment = app.containment.ProjectContainment.from_tk(engine.sgtk,
+                                                                 self.parent.get_setting("project_path_aliases"))
+        
+        # Every folder we look in is only listed once per scan, however many
+        # image sources read from it.
+        directory_cache = app.listing.DirectoryCache()
         
         references_scanned = 0
         tasks = []
@@ -85,8 +96,7 @@ class ScanSceneHook(hook):
                     log("tk-multi-collectfiles found no image sources to process.", 8)
                     continue
                 
-                fields = engine.context.as_template_fields(destination_path_template)
-                target_path = destination_path_template.apply_fields(fields)
+                target_path = resolver.apply(engine.context, destination_path_template)
                 
                 for image in images:
                     references_scanned += 1
@@ -100,21 +110,17 @@ class ScanSceneHook(hook):
                     if not os.path.isabs(filename):
                         # Relative paths should always be inside the project.
                         continue
-                    if filename.startswith(engine.sgtk.project_path):
+                    if containment.contains(filename):
                         continue
                     
                     
                     source_path,file = os.path.split(filename)
                     
                     # Then determine if it is a sequence:
-                    if file.find("[") != -1:
+                    sequence = app.sequences.parse_pattern(file)
+                    if sequence:
                         log("Image source is a sequence.",16)
-                        sequence_name = file.split("[")[0]
-                        sequence_ext = file.split("]")[1]
-                        is_sequence = True
-                    elif file.find("<UDIM>") != -1:
-                        log("Image source is a UDIM sequence.",16)
-                        sequence_name, sequence_ext = file.split("<UDIM>")
+                        sequence_name = sequence.prefix
                         is_sequence = True
                     else:
                         log("Image source is not a sequence.",16)
@@ -123,8 +129,8 @@ class ScanSceneHook(hook):
                     # Now we build the lists of source and target filenames:
                         
                     if is_sequence:
-                        source_files = glob.glob(os.path.join(source_path,sequence_name+"*"+sequence_ext))
-                        target_files = [os.path.join(target_path,sequence_name.rstrip('.'),os.path.split(source_file)[1]) for source_file in source_files]
+                        source_files = sequence.files(source_path, directory_cache)
+                        target_files = source_files.with_folder(os.path.join(target_path,sequence_name.rstrip('.')))
                         new_filename = os.path.join(target_path,sequence_name.rstrip('.'),file)
                     else:
                         new_filename = os.path.join(target_path,file)
@@ -132,15 +138,18 @@ class ScanSceneHook(hook):
                         target_files = [new_filename]
                         
                     
-                    tasks += [{ "type": "image_source",
-                                "name": image.FullName,
-                                "source_files":source_files,
-                                "target_files":target_files,
-                                "error":False,
-                                "other_params":{"new_filename":new_filename,
-                                    "task_object":image
-                                    }
-                                }]
+                    tasks += [app.tasks.CollectionTask("image_source", image.FullName, source_files, target_files,
+                                                       other_params={"new_filename":new_filename,
+                                                                     "task_object":image
+                                                                     })]
             else:
                 raise TankError("Item type '"+type["type"]+" in configuration is not supported by hook!")
-        return references_scanned, tasks
\ No newline at end of file
+        return references_scanned, tasks
+    
+    def scene_path(self, **kwargs):
+        """
+        Returns the path of the current scene, or None if it hasn't been
+        saved yet.
+        """
+        path = Application.ActiveProject.ActiveScene.Parameters("Filename").Value
+        return path or None
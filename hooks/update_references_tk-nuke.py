@@ -12,7 +12,7 @@ import sgtk
 from sgtk import Hook
 from sgtk import TankError
 
-
+from contextlib import contextmanager
 
 import nuke
 
@@ -33,12 +33,25 @@ class UpdateReferencesHook(Hook):
                             error:          Boolean
                             other_params:   Dictionary
                         }
+                        Tasks that can't be updated get an 'error_message'
+                        string describing what went wrong.
         
         :returns:       updated_count:  Integer
                                         Number of tasks successfully processed.
                         bad_object_names: Set
                                         Set of scene objects that were not successfully processed.
         """
+        if self.parent.get_setting("batch_reference_updates"):
+            nodes = [task["other_params"]["task_object"] for task in tasks
+                     if not task["error"] and task["type"].startswith("read_node")]
+            with self._batched_updates(nodes):
+                return self._update_tasks(tasks)
+        return self._update_tasks(tasks)
+    
+    def _update_tasks(self, tasks):
+        """
+        Updates the references of every task, see execute.
+        """
         engine = sgtk.platform.current_engine()
         task_count = 0
         bad_object_names = set()
@@ -52,11 +65,90 @@ class UpdateReferencesHook(Hook):
                 try:
                     self._update_read_node(task)
                     task_count += 1
-                except:
+                except Exception as e:
                     bad_object_names.add(task["name"])
+                    task["error_message"] = "Failed to update references: %s: %s" % (type(e).__name__, e)
                 
         return task_count, bad_object_names
     
+    def write_relinked_copy(self, tasks, path, **kwargs):
+        """
+        Saves a copy of the current script to 'path' with the references of
+        'tasks' updated, leaving the open script exactly as it was. Used to
+        package a script along with its files.
+
+        :tasks:         Tasks as for execute, whose 'new_filename' are relative
+                        to the folder 'path' is in.
+        :path:          Path to save the copy to.
+        """
+        root = nuke.root()
+        modified = root.modified()
+        saved = []
+        nuke.Undo.disable()
+        try:
+            # relative paths are resolved against the folder of the script
+            knob = root["project_directory"]
+            saved.append((knob, knob.value()))
+            knob.setValue("[python {nuke.script_directory()}]")
+            for task in tasks:
+                if task["error"] or not task["type"].startswith("read_node"):
+                    continue
+                knob = task["other_params"]["task_object"]["file"]
+                saved.append((knob, knob.value()))
+                self._update_read_node(task)
+            # unlike scriptSaveAs, this doesn't change the name of the open script
+            nuke.scriptSave(path)
+        finally:
+            for knob, value in reversed(saved):
+                knob.setValue(value)
+            root.setModified(modified)
+            nuke.Undo.enable()
+
+    @contextmanager
+    def _batched_updates(self, nodes):
+        """
+        Applies every change made in the with block as a single undo step,
+        with knobChanged callbacks and the postage stamps of 'nodes' suspended,
+        so relinking hundreds of Read nodes doesn't fire hundreds of callbacks
+        and thumbnail renders. Everything is restored, and the UI refreshed
+        once, at the end.
+
+        Suspending and restoring happen with undo disabled, outside of the
+        undo step, so undoing the relink only undoes the relink.
+        """
+        # global knobChanged callbacks, as added with nuke.addKnobChanged
+        knob_changeds = getattr(getattr(nuke, "callbacks", None), "knobChangeds", None)
+        saved_callbacks = None
+        suspended = []
+        try:
+            nuke.Undo.disable()
+            try:
+                if isinstance(knob_changeds, dict):
+                    saved_callbacks = dict(knob_changeds)
+                    knob_changeds.clear()
+                for node in nodes:
+                    for name, off in (("knobChanged", ""), ("postage_stamp", False)):
+                        knob = node.knob(name)
+                        if knob is not None and knob.value():
+                            suspended.append((knob, knob.value()))
+                            knob.setValue(off)
+            finally:
+                nuke.Undo.enable()
+            nuke.Undo.begin("Collect External Files")
+            try:
+                yield
+            finally:
+                nuke.Undo.end()
+        finally:
+            nuke.Undo.disable()
+            try:
+                for knob, value in reversed(suspended):
+                    knob.setValue(value)
+                if saved_callbacks is not None:
+                    knob_changeds.update(saved_callbacks)
+            finally:
+                nuke.Undo.enable()
+            nuke.updateUI()
     
     def _update_read_node(self, task):
         
@@ -37,6 +37,8 @@ class UpdateReferencesHook(Hook):
                             error:          Boolean
                             other_params:   Dictionary
                         }
+                        Tasks that can't be updated get an 'error_message'
+                        string describing what went wrong.
         
         :returns:       updated_count:  Integer
                                         Number of tasks successfully processed.
@@ -54,6 +56,7 @@ class UpdateReferencesHook(Hook):
                 try:
                     task["other_params"]["task_object"].FileName.Value = task["other_params"]["new_filename"]
                     task_count += 1
-                except:
+                except Exception as e:
                     bad_object_names.add(task["name"])
+                    task["error_message"] = "Failed to update references: %s: %s" % (type(e).__name__, e)
         return task_count, bad_object_names
\ No newline at end of file
@@ -9,3 +9,8 @@
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
 from . import collect_files
+from . import containment
+from . import listing
+from . import resolver
+from . import sequences
+from . import tasks
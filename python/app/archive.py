@@ -0,0 +1,71 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import time
+
+from .plan import normalize_path
+
+# Extension of the archive for each package_format and package_compression.
+EXTENSIONS = {("tar", "none"): ".tar",
+              ("tar", "fast"): ".tar.gz",
+              ("zip", "none"): ".zip",
+              ("zip", "fast"): ".zip",
+              }
+
+
+def archive_name(path, roots):
+    """
+    Returns the name a file is stored under in a package: its path relative
+    to the first of 'roots' it is inside of, with forward slashes. Paths
+    outside all of the roots keep their whole path, under "external/".
+
+    :path:  Path the file would be collected to.
+    :roots: Project root folders, e.g. the project path and storage roots.
+    """
+    normalized = normalize_path(path)
+    for root in roots:
+        normalized_root = normalize_path(root).rstrip("/\\")
+        if normalized.startswith(normalized_root + os.sep):
+            return os.path.relpath(path, root).replace("\\", "/")
+    drive, tail = os.path.splitdrive(path)
+    return "external/" + (drive.strip(":/\\") + "/" + tail.replace("\\", "/").lstrip("/")).lstrip("/")
+
+
+def build_path_map(archive_path, tasks, files, failures, script_name=None, scene_path=None):
+    """
+    Describes where everything went in a package, to be written next to the
+    archive as JSON so the receiving end can map the files back.
+
+    :archive_path:  Path of the archive.
+    :tasks:         Task list, with each task's 'new_filename' already
+                    turned into a name inside the archive. Tasks with errors
+                    get no path.
+    :files:         List of (source_path, name in archive) tuples packaged.
+    :failures:      Dictionary mapping each source path that couldn't be
+                    packaged to the error message.
+    :script_name:   Name of the relinked script inside the archive, if one
+                    was written.
+    :scene_path:    Path of the work file that was packaged.
+
+    :returns:   Dictionary that can be written out as JSON.
+    """
+    return {"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "archive": os.path.basename(archive_path),
+            "scene_path": scene_path,
+            "script": script_name,
+            "files": [{"source": source, "path": name} for source, name in files if source not in failures],
+            "objects": [{"name": task["name"],
+                         "type": task["type"],
+                         "path": None if task.get("error") else (task.get("other_params") or {}).get("new_filename"),
+                         "error": task.get("error_message"),
+                         } for task in tasks],
+            "failures": [{"source": source, "message": message} for source, message in sorted(failures.items())],
+            }
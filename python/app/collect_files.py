@@ -11,29 +11,71 @@
 import sgtk
 import os
 import sys
+import time
+import shutil
+import hashlib
+import tempfile
 import threading
 
 # by importing QT from sgtk rather than directly, we ensure that
 # the code will be compatible with both PySide and PyQt.
 from sgtk.platform.qt import QtCore, QtGui
+
 #from .ui.dialog import Ui_Dialog
 
+from . import copy_engine
+from .plan import CollectionPlan, normalize_path
+from .manifest import CollectionManifest
+from .journal import CollectionJournal
+from .listing import DirectoryCache, is_unchanged_copy
+from .manifest import write_json
+from . import plan_report
+from . import archive
+from .progress import CollectionProgress, CollectionCancelled
+from .metrics import CollectionMetrics
+from .governor import IOGovernor
+from .relink import RelinkQueue
+from .progress_widget import ProgressWidget, format_bytes
+
+# What the copy hook returns for a file whose target was already up to date.
+UP_TO_DATE = "up_to_date"
+
 def execute():
     self = CollectFiles()
     CollectFiles.execute(self)
 
-class CollectFiles(QtGui.QWidget):
+def plan():
+    self = CollectFiles()
+    CollectFiles.plan(self)
+
+def package():
+    self = CollectFiles()
+    CollectFiles.package(self)
+
+def collect_headless(overwrite_policy="never"):
+    self = CollectFiles(headless=True, overwrite_policy=overwrite_policy)
+    return CollectFiles.collect(self)
+
+class CollectFiles(object):
     """
     
     """
     
-    def __init__(self):
+    # Copies that may be queued up ahead of the workers before the scan waits
+    # for them, when collecting in the foreground.
+    STREAM_QUEUE_SIZE = 256
+    
+    def __init__(self, headless=False, overwrite_policy=None):
         """
         Constructor
-        """
         
-        # first, call the base class and let it do its thing.
-        QtGui.QWidget.__init__(self)
+        :headless:          If True nothing is shown to the user: there are no
+                            prompts or dialogs and the summary is logged.
+        :overwrite_policy:  "ask", "always" or "never". Overrides the
+                            overwrite_policy setting. "ask" is treated as
+                            "never" when running headless.
+        """
+        self._headless = headless
         
         """
         # now load in the UI that was created in the UI designer
@@ -44,6 +86,33 @@ class CollectFiles(QtGui.QWidget):
         # it is often handy to keep a reference to this. You can get it via the following method:
         self._app = sgtk.platform.current_bundle()
         
+        # record of files collected by earlier runs, so unchanged files can be skipped
+        self._manifest = CollectionManifest(os.path.join(self._app.cache_location, "collection_manifest.json"))
+        # log of the copies in flight, so an interrupted collection can be
+        # resumed, see _start_plan
+        self._journal = None
+        self._directory_cache = None
+        # where the time of this collection goes, see _log_metrics
+        self._metrics = CollectionMetrics()
+        # tasks waiting for their files when relinking as they land, see _relink_as_copied
+        self._relink_queue = None
+        # whether the copy hook has an execute_batch method, see _copy_batch
+        self._hook_can_batch = True
+        # CopyEngine of the collection in progress, see _start_copy
+        self._copy_engine = None
+        # path of the open scene, read on the main thread, see _resolve_scene_path
+        self._scene_path = None
+        
+        self._overwrite_policy = overwrite_policy or self._app.get_setting("overwrite_policy")
+        if self._headless and self._overwrite_policy == "ask":
+            self._overwrite_policy = "never"
+        # the last answer to the overwrite prompt, see _approve
+        self._overwrite_answer = QtGui.QMessageBox.Yes
+        if self._overwrite_policy == "always":
+            self._overwrite_answer = QtGui.QMessageBox.YesToAll
+        elif self._overwrite_policy == "never":
+            self._overwrite_answer = QtGui.QMessageBox.NoToAll
+        
         # via the self._app handle we can for example access:
         # - The engine, via self._app.engine
         # - A Shotgun API instance, via self._app.shotgun
@@ -58,50 +127,733 @@ class CollectFiles(QtGui.QWidget):
         """
         Make thing go.
         """
-                
+        if self._app.get_setting("run_in_background") and not self._headless:
+            self._execute_in_background()
+            return True
+        
+        self.collect()
+        return True
+    
+    def collect(self):
+        """
+        Runs a whole collection on the calling thread, as execute() does
+        with run_in_background off, and returns the outcome rather than just
+        showing it. Used by the headless batch scripts.
+        
+        :returns:   Dictionary with the number of 'references_scanned', the
+                    number of objects 'updated' and a sorted list of the
+                    names of the objects that had 'errors'.
+        """
+        references_scanned, tasks, engine = self._scan_and_start_copy()
+        if self._relink_queue is not None:
+            updated_count, bad_object_names = self._relink_as_copied(tasks)
+            bad_object_names = bad_object_names.union(self._finish_copy(tasks, engine))
+        else:
+            bad_object_names = self._finish_copy(tasks, engine)
+            updated_count, more_bad_object_names = self._update_references(tasks)
+            bad_object_names = bad_object_names.union(more_bad_object_names)
+        self._log_metrics(references_scanned, updated_count, tasks)
+        self._report(references_scanned, updated_count, bad_object_names)
+        return {"references_scanned": references_scanned,
+                "updated": updated_count,
+                "errors": sorted(bad_object_names),
+                }
+    
+    def plan(self):
+        """
+        Works out what a collection would do without copying anything or
+        touching any references, and writes it out as a JSON plan next to the
+        work file.
+        """
+        self._resolve_scene_path()
+        references_scanned, tasks = self._scan()
+        plan, pending = self._build_plan(tasks)
+        report = plan_report.build_report(references_scanned, tasks, plan, self._stat)
+        
+        plan_path = self._output_path("collection_plan.json")
+        write_json(plan_path, report)
+        
+        summary = report["summary"]
+        log_msg = ("Collecting would copy "+str(summary["files"])+" files ("+format_bytes(summary["bytes"])+")"
+                   " for "+str(len(pending))+" of "+str(len(tasks))+" objects. "
+                   +str(summary["up_to_date_files"])+" files are already up to date.")
+        if report["conflicts"]:
+            log_msg += "\n\n"+str(len(report["conflicts"]))+" existing files would need to be overwritten."
+        if summary["missing_files"]:
+            log_msg += "\n\n"+str(summary["missing_files"])+" source files are missing."
+        clashing = [task["name"] for task in tasks if task.get("error")]
+        if clashing:
+            log_msg += ("\n\nThe following objects would be skipped, their files would be collected to the same"
+                        " targets as another object's:\n"+"\n".join(sorted(clashing)))
+        if not all(volume["fits"] for volume in report["target_volumes"].values()):
+            log_msg += "\n\nThere is not enough free space on the target storage!"
+        log_msg += "\n\nThe full plan was written to:\n"+plan_path
+        self._show_message(log_msg)
+        return report
+    
+    def package(self, archive_path=None):
+        """
+        Gathers the external files of the scene into a single archive, for a
+        delivery or an offline handoff, instead of copying them into the
+        project. Streaming everything into one file replaces a file create
+        per frame with large sequential writes.
+        
+        Files are stored under their path relative to the project, laid out
+        as a collection would lay them out, and a JSON path map is written
+        next to the archive. With the package_relinked_script setting a copy
+        of the scene relinked to those paths is stored at the root of the
+        archive. The open scene itself is left as it is.
+        
+        :archive_path:  Path of the archive to write. Defaults to one next
+                        to the work file.
+        
+        :returns:   The path map, as written next to the archive.
+        """
+        scene_path = self._resolve_scene_path()
+        references_scanned, tasks = self._scan()
+        archive_format = self._app.get_setting("package_format")
+        compression = self._app.get_setting("package_compression")
+        if archive_path is None:
+            archive_path = self._output_path("collection_package"+archive.EXTENSIONS[(archive_format, compression)])
+        tk = self._app.engine.sgtk
+        roots = [tk.project_path] + [path for path in tk.roots.values() if path]
+        
+        with self._metrics.phase("plan"):
+            self._directory_cache = None
+            if self._app.get_setting("directory_sync"):
+                self._directory_cache = DirectoryCache()
+            plan = CollectionPlan()
+            for i, task in enumerate(tasks):
+                if task["source_files"]:
+                    task["error"] = False
+                    plan.add_task(i, task)
+            files = []
+            planned_files = {}
+            for planned in plan.files():
+                source_stat = self._stat(planned.source)
+                if source_stat is None:
+                    # flagged now, so the relinked scene keeps pointing at
+                    # the original path
+                    for i in planned.task_indices:
+                        tasks[i]["error"] = True
+                        tasks[i]["error_message"] = "Source file is missing: %s" % planned.source
+                    continue
+                planned.size, planned.mtime = source_stat
+                files.append((planned.source, archive.archive_name(planned.target, roots)))
+                planned_files[planned.source] = planned
+            for task in tasks:
+                other_params = task.get("other_params") or {}
+                if other_params.get("new_filename"):
+                    other_params["new_filename"] = archive.archive_name(other_params["new_filename"], roots)
+        
+        script_name = None
+        script_path = None
+        temp_dir = None
+        if self._app.get_setting("package_relinked_script") and scene_path:
+            temp_dir = tempfile.mkdtemp(prefix="collect_files_")
+        try:
+            if temp_dir:
+                script_name = os.path.basename(scene_path)
+                script_path = os.path.join(temp_dir, script_name)
+                try:
+                    self._app.execute_hook_method("hook_update_references", "write_relinked_copy",
+                                                  tasks=tasks, path=script_path)
+                except (AttributeError, sgtk.TankError):
+                    self._app.log_warning("The update references hook can't write a relinked copy of the scene, "
+                                          "only its files are packaged.")
+                    script_name = script_path = None
+            
+            with self._metrics.phase("copy"):
+                failures = self._app.execute_hook_method("hook_package_files", "execute",
+                                                         archive_path=archive_path,
+                                                         files=files + ([(script_path, script_name)] if script_name else []),
+                                                         archive_format=archive_format,
+                                                         compression=compression,
+                                                         read_threads=self._app.get_setting("copy_threads"))
+        finally:
+            # whatever the hooks raise, the relinked copy isn't left behind
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+        
+        bad_object_names = set(task["name"] for task in tasks if task.get("error"))
+        for source, message in failures.items():
+            if source == script_path:
+                script_name = None
+                continue
+            for i in planned_files[source].task_indices:
+                bad_object_names.add(tasks[i]["name"])
+                tasks[i]["error"] = True
+                tasks[i]["error_message"] = "Failed to package %s: %s" % (source, message)
+        
+        path_map = archive.build_path_map(archive_path, tasks, files, failures, script_name, scene_path)
+        path_map_path = archive_path+".paths.json"
+        write_json(path_map_path, path_map)
+        
+        total_bytes = sum(planned.size for source, planned in planned_files.items() if source not in failures)
+        log_msg = ("Packaged "+str(len(path_map["files"]))+" files ("+format_bytes(total_bytes)+") for "
+                   +str(len(tasks))+" objects into:\n"+archive_path+"\n\nThe path map was written to:\n"+path_map_path)
+        if script_name:
+            log_msg += "\n\nThe archive includes a copy of the scene relinked to the packaged files: "+script_name
+        if bad_object_names:
+            log_msg += "\n\nThe files of the following scene objects could not be packaged:\n"
+            for object_name in sorted(bad_object_names):
+                log_msg += "\n"+object_name
+        self._show_message(log_msg)
+        return path_map
+    
+    def _output_path(self, suffix):
+        """
+        Returns the path of a file to write next to the current work file,
+        named after it, or in the app's cache location if the scene hasn't
+        been saved.
+        """
+        if self._scene_path:
+            return os.path.splitext(self._scene_path)[0]+"."+suffix
+        return os.path.join(self._app.cache_location, suffix)
+    
+    def _resolve_scene_path(self):
+        """
+        Asks the scan scene hook for the path of the open scene, once per
+        collection, for everything named after the scene. Must be called on
+        the main thread, it uses the DCC's API. Hooks that don't have a
+        scene_path method are treated as an unsaved scene.
+        
+        :returns:   The path, or None.
+        """
+        try:
+            self._scene_path = self._app.execute_hook_method("hook_scan_scene", "scene_path")
+        except (AttributeError, sgtk.TankError):
+            self._app.log_debug("The scan scene hook can't tell the scene path, treating the scene as unsaved.")
+            self._scene_path = None
+        return self._scene_path
+    
+    def _execute_in_background(self):
+        """
+        Copies the files on background threads while a non-modal progress
+        widget is shown, so the artist can keep working. Only the scan, which
+        also asks about any overwrites, and the reference update run on the
+        main thread.
+        """
+        progress = CollectionProgress()
+        self._app.engine.show_dialog("Collect External Files", self._app, ProgressWidget, progress)
+        
+        try:
+            references_scanned, tasks, engine = self._scan_and_start_copy(progress)
+        except Exception as e:
+            # the widget is already up, it must not be left waiting
+            self._app.log_exception("Collect External Files failed.")
+            progress.set_status("Failed: %s" % e, finished=True)
+            return
+
+        worker = threading.Thread(target=self._background_collect,
+                                  args=(references_scanned, tasks, engine, progress))
+        worker.daemon = True
+        worker.start()
+    
+    def _background_collect(self, references_scanned, tasks, engine, progress):
+        """
+        Body of the background collection thread.
+        """
+        try:
+            if self._relink_queue is not None:
+                updated_count, bad_object_names = self._relink_as_copied(tasks, progress)
+                bad_object_names = bad_object_names.union(self._finish_copy(tasks, engine))
+            else:
+                bad_object_names = self._finish_copy(tasks, engine)
+                if progress.is_cancelled():
+                    progress.set_status("Cancelled, updating links for completed objects...")
+                else:
+                    progress.set_status("Updating links...")
+                updated_count, more_bad_object_names = self._app.engine.execute_in_main_thread(self._update_references, tasks)
+                bad_object_names = bad_object_names.union(more_bad_object_names)
+        except Exception as e:
+            self._app.log_exception("Collect External Files failed.")
+            progress.set_status("Failed: %s" % e, finished=True)
+            return
+        
+        if progress.is_cancelled():
+            progress.set_status("Cancelled.", finished=True)
+        else:
+            progress.set_status("Done.", finished=True)
+        self._log_metrics(references_scanned, updated_count, tasks, cancelled=progress.is_cancelled())
+        self._report(references_scanned, updated_count, bad_object_names, cancelled=progress.is_cancelled())
+    
+    def _scan(self):
+        """
+        Runs the scan scene hook.
+        """
+        with self._metrics.phase("scan"):
+            return self._app.execute_hook_method("hook_scan_scene", "execute")
+    
+    def _scan_and_start_copy(self, progress=None):
+        """
+        Scans the scene and starts copying each task's files as soon as the
+        scan hook yields the task, so the copy doesn't wait for the whole
+        scene to be scanned. Must be called on the main thread.
+        
+        :progress:  CollectionProgress of a background collection. Without
+                    one the scan waits whenever STREAM_QUEUE_SIZE copies are
+                    already queued, rather than running ahead of them.
+        
+        With the incremental_reference_updates setting on, each task is also
+        added to a RelinkQueue, see _relink_as_copied.
+        
+        :returns:   Tuple (references_scanned, tasks, engine). The copies may
+                    still be running, pass the engine to _finish_copy.
+        """
+        counters = {"references_scanned": 0}
+        self._resolve_scene_path()
+        self._relink_queue = None
+        if self._app.get_setting("incremental_reference_updates"):
+            self._relink_queue = RelinkQueue()
+        # the journal is recovered before _start_copy starts a new one
+        plan = self._start_plan()
+        engine = self._start_copy(progress, max_pending=0 if progress else self.STREAM_QUEUE_SIZE)
+        tasks = []
+        # The scan phase covers planning and queuing the copies too, and the
+        # copy phase is however long copying carries on after the scan.
+        with self._metrics.phase("scan"):
+            try:
+                for task in self._stream_tasks(counters):
+                    i = len(tasks)
+                    tasks.append(task)
+                    planned_files = [] if self._relink_queue is not None else None
+                    new_files = self._plan_task(plan, i, task, planned_files)
+                    jobs = self._approve(task, new_files) if new_files else []
+                    # smaller tasks are copied first, so more of the scene is
+                    # done sooner
+                    num_bytes = sum(planned.size or 0 for planned, source, target in jobs)
+                    if self._relink_queue is not None:
+                        self._relink_queue.copying([planned for planned, source, target in jobs])
+                    self._submit(engine, jobs, priority=num_bytes)
+                    if self._relink_queue is not None:
+                        self._relink_queue.add_task(i, planned_files, num_bytes)
+            except Exception:
+                # let whatever was queued finish, so the journal is consistent
+                self._finish_copy(tasks, engine)
+                raise
+        if self._relink_queue is not None:
+            self._relink_queue.close()
+        return counters["references_scanned"], tasks, engine
+    
+    def _stream_tasks(self, counters):
+        """
+        Returns an iterable of the tasks of the scan scene hook. Uses the
+        hook's execute_streaming method, which yields tasks as it finds them
+        and keeps counters["references_scanned"] up to date, and falls back
+        on execute for hooks that don't have one.
+        """
+        try:
+            return self._app.execute_hook_method("hook_scan_scene", "execute_streaming", counters=counters)
+        except (AttributeError, sgtk.TankError):
+            # execute_streaming returns a generator, so nothing of the scan
+            # itself has run yet if it's missing
+            self._app.log_debug("The scan scene hook can't stream, scanning the whole scene first.")
         references_scanned, tasks = self._app.execute_hook_method("hook_scan_scene", "execute")
-        count = len(tasks)
+        counters["references_scanned"] = references_scanned
+        return tasks
+    
+    def _relink_as_copied(self, tasks, progress=None):
+        """
+        Updates the references of each task as soon as every file it needs
+        has been copied, smallest tasks first, until every task has been
+        handed out by the RelinkQueue. The update hook always runs on the
+        main thread, so a script is usable piece by piece and a crash late in
+        a long collection doesn't lose the links already updated.
         
-        tasks, bad_object_names = self._copy_files(tasks)
-        updated_count, more_bad_object_names = self._app.execute_hook_method("hook_update_references","execute", tasks=tasks)
-        bad_object_names = bad_object_names.union(more_bad_object_names)
+        :progress:  CollectionProgress of a background collection, which
+                    is what runs this on a background thread.
+        
+        :returns:   Tuple (updated_count, bad_object_names), as the update
+                    references hook returns.
+        """
+        updated_count = 0
+        bad_object_names = set()
+        while True:
+            # the time spent waiting here is time spent copying
+            with self._metrics.phase("copy"):
+                ready = self._relink_queue.take()
+            if ready is None:
+                return updated_count, bad_object_names
+            if not ready:
+                continue
+            ready_tasks = []
+            for i, failure in ready:
+                if failure is not None:
+                    self._flag_failed(tasks[i], *failure)
+                ready_tasks.append(tasks[i])
+            if progress:
+                count, names = self._app.engine.execute_in_main_thread(self._update_references, ready_tasks)
+            else:
+                count, names = self._update_references(ready_tasks)
+            updated_count += count
+            bad_object_names.update(names)
+    
+    def _update_references(self, tasks):
+        """
+        Runs the update references hook. Must be called on the main thread.
+        """
+        with self._metrics.phase("update"):
+            return self._app.execute_hook_method("hook_update_references","execute", tasks=tasks)
+    
+    def _log_metrics(self, references_scanned, updated_count, tasks, cancelled=False):
+        """
+        Writes the metrics of the collection as a JSON report next to the work
+        file and hands them to the log metrics hook. Problems doing so are
+        logged rather than raised, they shouldn't fail the collection.
+        """
+        try:
+            report = self._metrics.report(references_scanned, updated_count, tasks, self._scene_path, cancelled)
+        except Exception:
+            self._app.log_exception("Failed to build the collection report.")
+            return
+        report_path = self._output_path("collection_report.json")
+        try:
+            write_json(report_path, report)
+        except (IOError, OSError):
+            self._app.log_exception("Failed to write the collection report.")
+            report_path = None
+        try:
+            self._app.execute_hook_method("hook_log_metrics", "execute", report=report, report_path=report_path)
+        except Exception:
+            self._app.log_exception("The log metrics hook failed.")
+    
+    def _report(self, references_scanned, updated_count, bad_object_names, cancelled=False):
+        """
+        Shows the user a summary of the collection.
+        """
         log_msg = "Found "+str(references_scanned)+" external file references, and copied & updated links on "+str(updated_count)+"."
+        if cancelled:
+            log_msg += "\n\nThe collection was cancelled before all files were copied."
         if bad_object_names:
             log_msg += "\n\ntk-multi-collectfiles also encountered errors processing the following scene objects. Please relocate their external files and update links manually:\n"
             object_list = list(bad_object_names)
             object_list.sort()
             for object_name in object_list:
                 log_msg += "\n"+object_name
+        self._show_message(log_msg)
+    
+    def _show_message(self, log_msg):
+        """
+        Shows a message to the user, or logs it when running headless.
+        """
+        if self._headless:
+            self._app.log_info(log_msg)
+            return
         self._app.engine.execute_in_main_thread(QtGui.QMessageBox.information, None, "Collect External Files", log_msg)
-        return True
     
-    def _copy_files(self,tasks):
+    def _approve(self, task, new_files):
         """
-        Internal method to copy files
+        Asks whether to overwrite the files of 'task' if they already exist,
+        as the overwrite policy says.
+        
+        :returns:   List of copy jobs for the approved files.
         """
-        bad_object_names = set()
-        result =  QtGui.QMessageBox.Yes
+        target0 = task["target_files"][0]
+        isfile = self._stat(target0) is not None
+        result = self._overwrite_answer
+        if isfile and (result != QtGui.QMessageBox.YesToAll and result != QtGui.QMessageBox.NoToAll):
+            result = QtGui.QMessageBox.question(QtGui.QWidget(),"Overwrite File?", "One or more files relating to object "+task["name"]+" already exist in the target location. Overwrite files for this task?", QtGui.QMessageBox.Yes | QtGui.QMessageBox.No | QtGui.QMessageBox.YesToAll | QtGui.QMessageBox.NoToAll, QtGui.QMessageBox.Yes)
+            self._overwrite_answer = result
+        if (not isfile) or (result == QtGui.QMessageBox.Yes or result == QtGui.QMessageBox.YesToAll):
+            return [(planned, planned.source, planned.target) for planned in new_files]
+        for planned in new_files:
+            planned.copy = False
+            self._metrics.file_skipped(planned.size, "declined")
+        return []
+    
+    def _build_plan(self, tasks):
+        """
+        Builds the CollectionPlan for 'tasks' and works out which of its files
+        actually need copying.
+        
+        :returns:   Tuple (plan, pending) where pending is a list of
+                    (task index, PlannedFiles) tuples for every task that has
+                    files of its own left to copy.
+        """
+        plan = self._start_plan()
+        pending = []
         for i, task in enumerate(tasks):
-            files = [(task["source_files"][j], task["target_files"][j]) for j in range(len(task["source_files"]))]
-            error_count = 0
-            
-            if files:
-                source0, target0 = files[0]
-                isfile = os.path.isfile(target0)
-                if isfile and (result != QtGui.QMessageBox.YesToAll and result != QtGui.QMessageBox.NoToAll):
-                    result = QtGui.QMessageBox.question(QtGui.QWidget(),"Overwrite File?", "One or more files relating to object "+task["name"]+" already exist in the target location. Overwrite files for this task?", QtGui.QMessageBox.Yes | QtGui.QMessageBox.No | QtGui.QMessageBox.YesToAll | QtGui.QMessageBox.NoToAll, QtGui.QMessageBox.Yes)
-                if (not isfile) or (result == QtGui.QMessageBox.Yes or result == QtGui.QMessageBox.YesToAll):
-                    for source,target in files:
-                        try:
-                            self._app.execute_hook_method("hook_copy_file","execute",source_path=source,target_path=target)
-                        except:
-                            error_count += 1
-
-                if error_count == 0:
-                    tasks[i]["error"] = False
-                else:
-                    bad_object_names.add(task["name"])
-                    tasks[i]["error"] = True
-                
+            new_files = self._plan_task(plan, i, task)
+            if new_files:
+                pending.append((i, new_files))
+        return plan, pending
+    
+    def _start_plan(self):
+        """
+        Returns a new, empty CollectionPlan, with the state needed to check
+        which files are up to date set up.
+        """
+        # In sync mode each source and target folder is listed once and files
+        # are compared in memory, rather than stat'ing every file one by one.
+        self._directory_cache = None
+        if self._app.get_setting("directory_sync"):
+            self._directory_cache = DirectoryCache()
+        # pick up anything an interrupted collection already finished
+        self._journal = CollectionJournal(self._journal_path())
+        self._journal.recover(self._manifest)
+        return CollectionPlan()
+    
+    def _journal_path(self):
+        """
+        Returns the path of the journal of the open scene. Each scene has its
+        own, so collections of different scenes running at the same time,
+        e.g. from scripts/collect_batch.py, don't write over each other's.
+        An unsaved scene can't be resumed, it gets one per process.
+        """
+        if self._scene_path:
+            key = normalize_path(self._scene_path)
+            if not isinstance(key, bytes):
+                key = key.encode("utf-8")
+            name = hashlib.md5(key).hexdigest()[:16]
+        else:
+            name = "untitled_%d" % os.getpid()
+        return os.path.join(self._app.cache_location, "collection_journal_%s.jsonl" % name)
+    
+    def _plan_task(self, plan, i, task, planned_files=None):
+        """
+        Adds task 'i' to the plan, and every PlannedFile it needs to the list
+        'planned_files' if given.
+        
+        :returns:   List of the PlannedFiles the task needs copied, which no
+                    earlier task has already planned.
+        """
+        if not task["source_files"]:
+            return []
+        
+        # the plan flags the task if it clashes with another one
+        task["error"] = False
+        new_files = plan.add_task(i, task, planned_files)
+        to_copy = []
+        for planned in new_files:
+            if self._is_up_to_date(planned):
+                self._metrics.file_skipped(planned.size, "up_to_date")
+            else:
+                to_copy.append(planned)
+        # if empty, every file is either already being handled for another
+        # task or was collected by an earlier run and hasn't changed since
+        return to_copy
+    
+    def _stat(self, path):
+        """
+        Returns a (size, mtime) tuple for 'path', or None if it doesn't exist.
+        Answered from the directory listings in sync mode.
+        """
+        if self._directory_cache is not None:
+            return self._directory_cache.stat(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime
+    
+    def _is_up_to_date(self, planned):
+        """
+        Checks whether a planned file was already collected by an earlier run,
+        or in sync mode whether the target already matches the source, and
+        records the source size and modification time on it for the manifest.
+        """
+        # the plan builds paths as they are read
+        source, target = planned.source, planned.target
+        source_stat = self._stat(source)
+        if source_stat is None:
+            # let the copy hook report the missing file
+            return False
+        planned.size, planned.mtime = source_stat
+        planned.resume = self._journal.can_resume(source, planned.size, planned.mtime, target)
+        
+        if self._directory_cache is None and self._manifest.get(source) is None:
+            return False
+        target_stat = self._stat(target)
+        if target_stat is None:
+            return False
+        if self._directory_cache is not None and is_unchanged_copy(source_stat, target_stat):
+            # the same check the copy hook makes, done in memory
+            planned.up_to_date = True
+        else:
+            planned.up_to_date = self._manifest.is_current(source, planned.size, planned.mtime,
+                                                           target, target_stat[0])
+        return planned.up_to_date
+    
+    def _start_copy(self, progress=None, max_pending=0):
+        """
+        Starts a copy engine, and the journal, ready for jobs to be submitted.
+        Must be called after _start_plan, which reads the previous journal.
+        """
+        governor = None
+        if self._app.get_setting("max_bytes_per_second") > 0:
+            governor = IOGovernor(self._app.get_setting("max_bytes_per_second"))
+        batch_size = self._app.get_setting("copy_batch_size")
+        engine = copy_engine.CopyEngine(self._copy_file,
+                                        max_workers=self._app.get_setting("copy_threads"),
+                                        max_per_volume=self._app.get_setting("copy_threads_per_volume"),
+                                        governor=governor,
+                                        low_priority=self._app.get_setting("low_priority_copies"),
+                                        on_done=self._copy_done,
+                                        batch_func=self._copy_batch if batch_size > 1 else None,
+                                        batch_size=batch_size)
+        self._journal.open()
+        engine.start(progress, max_pending)
+        self._copy_engine = engine
+        return engine
+    
+    def _submit(self, engine, jobs, priority=0):
+        """
+        Journals and queues copy jobs on an engine from _start_copy, see
+        CopyEngine.submit for 'priority'.
+        """
+        if not jobs:
+            return
+        self._journal.planned([planned for planned, source, target in jobs])
+        # the plan already knows the size of each file, for the progress
+        engine.submit_batch([(planned, source, target, planned.size) for planned, source, target in jobs], priority)
+    
+    def _finish_copy(self, tasks, engine):
+        """
+        Waits for the copies submitted to 'engine' and flags every task that
+        depends on a file that failed.
+        
+        :returns:   Set of the names of the tasks that had errors.
+        """
+        bad_object_names = set()
+        with self._metrics.phase("copy"):
+            errors = engine.join()
+        try:
+            # the journal is only cleared once the manifest is safely written
+            self._manifest.save()
+        except (IOError, OSError):
+            self._app.log_exception("Failed to save the collection manifest.")
+        else:
+            try:
+                self._journal.close()
+            except (IOError, OSError):
+                self._app.log_exception("Failed to clear the collection journal.")
+        
+        for planned, failures in errors.items():
+            source, exc = failures[0]
+            for i in planned.task_indices:
+                bad_object_names.add(tasks[i]["name"])
+                self._flag_failed(tasks[i], source, exc)
 
-        return tasks, bad_object_names
\ No newline at end of file
+        return bad_object_names
+    
+    def _flag_failed(self, task, source, exc):
+        """
+        Marks 'task' as having a file that failed to copy, so its references
+        are left alone.
+        """
+        task["error"] = True
+        task["error_message"] = "Failed to copy %s: %s: %s" % (source, type(exc).__name__, exc)
+    
+    def _copy_done(self, planned, error):
+        """
+        Called from the copy engine's worker threads as each copy finishes.
+        """
+        if self._relink_queue is not None:
+            self._relink_queue.file_done(planned, error)
+    
+    def _copy_file(self, planned, source, target, progress_callback=None):
+        """
+        Copies a single file through the copy hook and records it in the
+        journal and manifest. Called from the copy engine's worker threads.
+        """
+        self._journal.started(planned)
+        start = time.time()
+        try:
+            # with verify_copies the hook returns the checksum of the data it
+            # copied, having checked the target against it
+            checksum = self._app.execute_hook_method("hook_copy_file","execute",source_path=source,target_path=target,
+                                                     progress_callback=progress_callback,resume=planned.resume,
+                                                     link_mode=self._app.get_setting("link_mode"),
+                                                     check_existing=self._directory_cache is None,
+                                                     verify=self._app.get_setting("verify_copies"))
+        except Exception:
+            self._metrics.file_failed(source, target, sys.exc_info())
+            raise
+        self._file_copied(planned, source, target, checksum, start, time.time())
+    
+    def _copy_batch(self, jobs, progress_callback=None):
+        """
+        Copies several files with a single call of the copy hook's
+        execute_batch, which creates all of their target folders up front.
+        Falls back on _copy_file for each file if the hook can't copy
+        batches. Called from the copy engine's worker threads.
+        
+        :returns:   Dictionary mapping the PlannedFile of each file that
+                    failed to the exception raised.
+        """
+        if not self._hook_can_batch:
+            return self._copy_each(jobs, progress_callback)
+        
+        for planned, source, target in jobs:
+            self._journal.started(planned)
+        start = time.time()
+        try:
+            results = self._app.execute_hook_method("hook_copy_file","execute_batch",
+                                                    pairs=[(source, target) for planned, source, target in jobs],
+                                                    progress_callback=progress_callback,
+                                                    resume=[target for planned, source, target in jobs if planned.resume],
+                                                    link_mode=self._app.get_setting("link_mode"),
+                                                    check_existing=self._directory_cache is None,
+                                                    verify=self._app.get_setting("verify_copies"))
+        except (AttributeError, sgtk.TankError):
+            # nothing has been copied if the method is missing
+            self._app.log_debug("The copy file hook can't copy batches, copying one file at a time.")
+            self._hook_can_batch = False
+            return self._copy_each(jobs, progress_callback)
+        except Exception:
+            for planned, source, target in jobs:
+                self._metrics.file_failed(source, target, sys.exc_info())
+            raise
+        
+        # the hook copies the files one after another, so each is given an
+        # even share of the time the batch took
+        share = (time.time() - start) / len(jobs)
+        failures = {}
+        for n, ((planned, source, target), result) in enumerate(zip(jobs, results)):
+            if isinstance(result, Exception):
+                self._metrics.file_failed(source, target, (type(result), result, getattr(result, "__traceback__", None)))
+                failures[planned] = result
+            else:
+                self._file_copied(planned, source, target, result, start + n * share, start + (n + 1) * share)
+        return failures
+    
+    def _copy_each(self, jobs, progress_callback=None):
+        """
+        Copies a batch of files one by one through _copy_file.
+        
+        :returns:   Dictionary of failures, as for _copy_batch.
+        """
+        failures = {}
+        for planned, source, target in jobs:
+            try:
+                self._copy_file(planned, source, target, progress_callback)
+            except CollectionCancelled:
+                raise
+            except Exception as e:
+                failures[planned] = e
+        return failures
+    
+    def _file_copied(self, planned, source, target, checksum, start, end):
+        """
+        Records a file the copy hook copied between the times 'start' and
+        'end' in the metrics, journal and manifest. 'checksum' is what the
+        hook returned, which is UP_TO_DATE if it found the target already
+        matched the source and didn't copy anything.
+        """
+        self._journal.done(planned)
+        if checksum == UP_TO_DATE:
+            self._metrics.file_skipped(planned.size, "up_to_date")
+            # the target was left as it was, so a checksum recorded by a
+            # verified copy of this same source still holds
+            record = self._manifest.get(source)
+            checksum = None
+            if record is not None and record["size"] == planned.size and record["mtime"] == planned.mtime:
+                checksum = record.get("checksum")
+        else:
+            self._metrics.file_copied(self._copy_engine.volume_of(source), planned.size, start, end)
+        if planned.size is not None:
+            if checksum:
+                self._manifest.record(source, planned.size, planned.mtime, target, checksum=checksum)
+            else:
+                self._manifest.record(source, planned.size, planned.mtime, target)
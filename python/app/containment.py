@@ -0,0 +1,115 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import re
+
+_DRIVE_RE = re.compile(r"^[A-Za-z]:")
+
+# marks the end of a root in the trie
+_END = None
+
+
+def path_components(path):
+    """
+    Splits a path into a tuple of normalized components for comparison.
+
+    Slashes are unified, empty and '.' components dropped, '..' resolved, and
+    Windows style paths (drive letter or UNC) are case folded, as is
+    everything when running on Windows. A UNC path keeps a leading '//'
+    component so it can't be confused with an absolute posix path.
+    """
+    path = path.replace("\\", "/")
+    is_unc = path.startswith("//")
+    if os.name == "nt" or is_unc or _DRIVE_RE.match(path):
+        path = path.lower()
+
+    components = ["//"] if is_unc else []
+    for component in path.split("/"):
+        if component in ("", "."):
+            continue
+        if component == "..":
+            if len(components) > (1 if is_unc else 0):
+                components.pop()
+            continue
+        components.append(component)
+    return tuple(components)
+
+
+class ProjectContainment(object):
+    """
+    Answers whether a path lies inside the project.
+
+    The same storage is often reached through several paths: UNC paths,
+    mapped drives, symlinked mounts. The index holds every known root of the
+    project, normalized, in a trie of path components, so each lookup is a
+    walk down the components of the path rather than a string comparison
+    against every root.
+    """
+
+    def __init__(self, roots=()):
+        """
+        Constructor
+
+        :roots: Paths whose contents count as inside the project.
+        """
+        self._trie = {}
+        for root in roots:
+            self.add_root(root)
+
+    @classmethod
+    def from_tk(cls, tk, aliases=()):
+        """
+        Builds the index for a Toolkit project.
+
+        :tk:        Sgtk instance.
+        :aliases:   Extra paths that also lead to project storage, e.g. the
+                    mapped drive or UNC equivalents of the storage roots.
+
+        :returns:   ProjectContainment
+        """
+        roots = [tk.project_path]
+        roots += [path for path in tk.roots.values() if path]
+        roots += list(aliases)
+        containment = cls(roots)
+        # symlinked mounts: also accept the paths the roots resolve to
+        for root in roots:
+            resolved = os.path.realpath(root)
+            if resolved != root:
+                containment.add_root(resolved)
+        return containment
+
+    def add_root(self, root):
+        """
+        Adds a path whose contents count as inside the project.
+        """
+        node = self._trie
+        for component in path_components(root):
+            if _END in node:
+                # a parent of this root is already in the index
+                return
+            node = node.setdefault(component, {})
+        node.clear()
+        node[_END] = True
+
+    def contains(self, path):
+        """
+        :returns:   True if 'path' is one of the roots or lies inside one.
+        """
+        node = self._trie
+        if not node:
+            return False
+        for component in path_components(path):
+            if _END in node:
+                return True
+            node = node.get(component)
+            if node is None:
+                return False
+        return _END in node
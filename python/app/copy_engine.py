@@ -0,0 +1,368 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import re
+import itertools
+import threading
+
+from .progress import CollectionCancelled
+from .governor import lower_thread_priority
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+_DRIVE_RE = re.compile(r"^[A-Za-z]:")
+
+
+def volume_key(path):
+    """
+    Returns a hashable key identifying the storage volume that 'path' lives on.
+
+    UNC paths are keyed on their server and share, drive letter paths on their
+    drive, and everything else on the device id of the nearest existing parent
+    folder, so that two mounts of the same filer are throttled separately but
+    two folders on the same disk share a limit.
+    """
+    path = path.replace("\\", "/")
+    if path.startswith("//"):
+        parts = path[2:].split("/")
+        return "//" + "/".join(parts[:2]).lower()
+    match = _DRIVE_RE.match(path)
+    if match:
+        return match.group(0).upper()
+
+    folder = path
+    while folder and not os.path.exists(folder):
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            break
+        folder = parent
+    try:
+        return os.stat(folder or "/").st_dev
+    except OSError:
+        return None
+
+
+class CopyEngine(object):
+    """
+    Runs file copies on a pool of worker threads.
+
+    The pool is bounded globally by 'max_workers' and per storage volume by
+    'max_per_volume', which applies to both the source and the target volume
+    of each copy so a single slow filer can't hog every worker.
+
+    Jobs are fed in between start() and join(), so copying starts while more
+    jobs are still being worked out. Queued jobs are picked up lowest
+    priority value first.
+
+    With a 'batch_func', jobs given to submit_batch() are copied in batches
+    of up to 'batch_size', one call per batch, which saves the per call
+    overhead of the copy hook on many small files.
+    """
+
+    def __init__(self, copy_func, max_workers=8, max_per_volume=4, governor=None, low_priority=False,
+                 on_done=None, batch_func=None, batch_size=32):
+        """
+        Constructor
+
+        :copy_func:         Callable taking (key, source_path, target_path,
+                            progress_callback) that performs a single file copy
+                            and raises on failure. progress_callback is None or
+                            a callable to be given the number of bytes written
+                            after each chunk, which raises CollectionCancelled
+                            if the copy should stop.
+        :max_workers:       Number of worker threads.
+        :max_per_volume:    Maximum concurrent copies reading from or writing
+                            to any one volume. 0 means no per volume limit.
+        :governor:          Optional IOGovernor capping the bandwidth used on
+                            each volume.
+        :low_priority:      Run the workers at a lowered CPU and I/O priority.
+        :on_done:           Optional callable taking (key, exception), called
+                            from the worker thread once each job has finished,
+                            with exception None if it succeeded.
+        :batch_func:        Optional callable taking a list of (key,
+                            source_path, target_path) jobs and a
+                            progress_callback as for copy_func, that copies
+                            them all and returns a dictionary mapping the key
+                            of each job that failed to its exception. Raising
+                            fails every job of the batch.
+        :batch_size:        Maximum number of jobs per call of batch_func.
+        """
+        self._copy_func = copy_func
+        self._max_workers = max(1, max_workers)
+        self._max_per_volume = max_per_volume
+        self._governor = governor
+        self._low_priority = low_priority
+        self._on_done = on_done
+        self._batch_func = batch_func
+        self._batch_size = max(1, batch_size)
+
+        self._lock = threading.Lock()
+        self._volume_keys = {}
+        self._volume_locks = {}
+
+        # state of the current run, see start()
+        self._pending = None
+        self._sequence = None
+        self._errors = {}
+        self._progress = None
+        self._workers = []
+
+    def start(self, progress=None, max_pending=0):
+        """
+        Gets ready to take jobs through submit(), for when they aren't all
+        known up front, e.g. while the scene is still being scanned. Workers
+        are started as jobs arrive.
+
+        :progress:      Optional CollectionProgress to report into. If it
+                        is cancelled, jobs that haven't finished fail with
+                        CollectionCancelled.
+        :max_pending:   Maximum number of jobs waiting for a worker, after
+                        which submit() blocks until one is picked up. 0 means
+                        no limit.
+        """
+        self._pending = queue.PriorityQueue(max(0, max_pending))
+        # keeps jobs of the same priority in the order they were submitted
+        self._sequence = itertools.count()
+        self._errors = {}
+        self._progress = progress
+        self._workers = []
+        if progress:
+            progress.start()
+
+    def submit(self, job, priority=0):
+        """
+        Queues a (key, source_path, target_path, size) job, to be picked up
+        before any queued job with a higher 'priority' value. May block if
+        the engine was started with max_pending.
+
+        The key is any hashable used to group the results, typically the
+        file's PlannedFile. size is the number of bytes the copy will write,
+        as far as it's known, or None. It's only used to report progress.
+        """
+        self._add_total(job)
+        self._start_worker()
+        self._pending.put((priority, next(self._sequence), job))
+
+    def submit_batch(self, jobs, priority=0):
+        """
+        Queues a list of jobs to be copied through batch_func, split into
+        batches of at most batch_size. Without a batch_func the jobs are
+        submitted one by one. May block as submit() does.
+        """
+        if self._batch_func is None:
+            for job in jobs:
+                self.submit(job, priority)
+            return
+        # smaller batches when there are few jobs, so that e.g. the frames
+        # of a single sequence are still spread over every worker
+        batch_size = min(self._batch_size, max(1, -(-len(jobs) // self._max_workers)))
+        for start in range(0, len(jobs), batch_size):
+            batch = jobs[start:start + batch_size]
+            for job in batch:
+                self._add_total(job)
+            self._start_worker()
+            self._pending.put((priority, next(self._sequence), batch))
+
+    def _add_total(self, job):
+        """
+        Adds a job to the work expected by the progress, if any.
+        """
+        if self._progress:
+            self._progress.add_total(1, job[3] or 0)
+
+    def _start_worker(self):
+        """
+        Starts another worker thread, unless there are already max_workers.
+        """
+        if len(self._workers) < self._max_workers:
+            worker = threading.Thread(target=self._worker, args=(self._pending, self._errors, self._progress))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def join(self):
+        """
+        Waits for every submitted job to finish.
+
+        :returns:   Dictionary mapping each key that had failures to a list
+                    of (source_path, exception) tuples.
+        """
+        for worker in self._workers:
+            self._pending.put((float("inf"), next(self._sequence), None))
+        for worker in self._workers:
+            worker.join()
+        return self._errors
+
+    def _worker(self, pending, errors, progress):
+        """
+        Worker thread loop, copies jobs until it is told to stop.
+        """
+        if self._low_priority:
+            lower_thread_priority()
+        while True:
+            priority, sequence, job = pending.get()
+            if job is None:
+                return
+            if isinstance(job, list):
+                self._run_batch(job, errors, progress)
+                continue
+            key, source, target, size = job
+
+            error = None
+            locks = self._locks_for(source, target)
+            for lock in locks:
+                lock.acquire()
+            try:
+                if progress:
+                    self._copy_with_progress(key, source, target, progress, size or 0)
+                elif self._governor:
+                    self._copy_func(key, source, target, self._throttle_for(source, target))
+                else:
+                    self._copy_func(key, source, target, None)
+            except Exception as e:
+                error = e
+                with self._lock:
+                    errors.setdefault(key, []).append((source, e))
+            finally:
+                for lock in reversed(locks):
+                    lock.release()
+            if self._on_done:
+                self._on_done(key, error)
+
+    def _run_batch(self, batch, errors, progress):
+        """
+        Copies a batch of (key, source, target, size) jobs with one call of
+        batch_func, holding the volume semaphores of every file in it.
+        """
+        paths = [path for key, source, target, size in batch for path in (source, target)]
+        jobs = [(key, source, target) for key, source, target, size in batch]
+        locks = self._locks_for(*paths)
+        for lock in locks:
+            lock.acquire()
+        try:
+            if progress:
+                failures = self._copy_batch_with_progress(jobs, progress, sum(job[3] or 0 for job in batch), paths)
+            elif self._governor:
+                failures = self._batch_func(jobs, self._throttle_for(*paths))
+            else:
+                failures = self._batch_func(jobs, None)
+        except Exception as e:
+            failures = dict((key, e) for key, source, target in jobs)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+        for key, source, target in jobs:
+            error = failures.get(key)
+            if error is not None:
+                with self._lock:
+                    errors.setdefault(key, []).append((source, error))
+            if self._on_done:
+                self._on_done(key, error)
+
+    def _copy_batch_with_progress(self, jobs, progress, size, paths):
+        """
+        Copies a batch of files, feeding the bytes they write into 'progress'.
+        """
+        progress.check_cancelled()
+        reported = [0]
+        progress_callback = self._progress_callback(progress, reported, paths)
+        try:
+            failures = self._batch_func(jobs, progress_callback)
+        except CollectionCancelled:
+            raise
+        except Exception:
+            self._batch_done(progress, len(jobs), max(0, size - reported[0]))
+            raise
+        self._batch_done(progress, len(jobs), max(0, size - reported[0]))
+        return failures
+
+    def _batch_done(self, progress, count, num_bytes):
+        """
+        Counts 'count' files as done, along with the bytes not yet reported.
+        """
+        for i in range(count - 1):
+            progress.file_done()
+        progress.file_done(num_bytes)
+
+    def _copy_with_progress(self, key, source, target, progress, size):
+        """
+        Copies a single file, feeding the bytes it writes into 'progress'.
+        """
+        progress.check_cancelled()
+        reported = [0]
+        progress_callback = self._progress_callback(progress, reported, (source, target))
+
+        try:
+            self._copy_func(key, source, target, progress_callback)
+        except CollectionCancelled:
+            raise
+        except Exception:
+            # count the file as done so the totals still add up
+            progress.file_done(max(0, size - reported[0]))
+            raise
+        progress.file_done(max(0, size - reported[0]))
+
+    def _progress_callback(self, progress, reported, paths):
+        """
+        Returns a progress callback for copying between 'paths', which checks
+        for cancellation, adds the bytes written to 'progress' and to
+        reported[0], and throttles if there is a governor.
+        """
+        throttle = self._throttle_for(*paths) if self._governor else None
+
+        def progress_callback(num_bytes):
+            progress.check_cancelled()
+            reported[0] += num_bytes
+            progress.add_bytes(num_bytes)
+            if throttle:
+                throttle(num_bytes)
+        return progress_callback
+
+    def _locks_for(self, *paths):
+        """
+        Returns the volume semaphores to hold while copying between 'paths',
+        in a stable order so that two workers can never deadlock on them.
+        """
+        if not self._max_per_volume:
+            return []
+
+        keys = set(self.volume_of(path) for path in paths)
+        with self._lock:
+            locks = []
+            for key in sorted(keys, key=repr):
+                if key not in self._volume_locks:
+                    self._volume_locks[key] = threading.Semaphore(self._max_per_volume)
+                locks.append(self._volume_locks[key])
+        return locks
+
+    def _throttle_for(self, *paths):
+        """
+        Returns the governor's throttling callback for copying between
+        'paths'.
+        """
+        return self._governor.callback([self.volume_of(path) for path in paths])
+
+    def volume_of(self, path):
+        """
+        Returns the volume key of the folder 'path' is in, cached per folder.
+        """
+        folder = os.path.dirname(path)
+        key = self._volume_keys.get(folder)
+        if key is None:
+            # resolving the volume may touch the filesystem, so do it
+            # outside of the lock. The worst case is resolving it twice.
+            key = volume_key(folder)
+            self._volume_keys[folder] = key
+        return key
@@ -0,0 +1,134 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import sys
+import time
+import platform
+import threading
+
+
+class TokenBucket(object):
+    """
+    Limits a stream of bytes to an average rate.
+
+    The bucket holds up to one second's worth of bytes. Callers take what
+    they have just transferred out of it and sleep off any shortfall, so
+    several threads sharing a bucket share its rate between them.
+    """
+
+    def __init__(self, rate):
+        """
+        Constructor
+
+        :rate:  Bytes per second.
+        """
+        self._rate = float(rate)
+        self._lock = threading.Lock()
+        self._tokens = self._rate
+        self._last = time.time()
+
+    def consume(self, num_bytes):
+        """
+        Takes 'num_bytes' out of the bucket, sleeping until the rate allows
+        them if the bucket runs dry.
+        """
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self._rate, self._tokens + (now - self._last) * self._rate)
+            self._last = now
+            # going into debt reserves the bytes, so threads queue up fairly
+            self._tokens -= num_bytes
+            wait = -self._tokens / self._rate
+        if wait > 0:
+            time.sleep(wait)
+
+
+class IOGovernor(object):
+    """
+    Caps the bandwidth copies may use on each storage volume, so a large
+    collection doesn't starve playback and renders reading from the same
+    filer. Every byte copied counts against both its source and its target
+    volume. Volumes are identified by the keys copy_engine.volume_key gives.
+    """
+
+    def __init__(self, bytes_per_second):
+        """
+        Constructor
+
+        :bytes_per_second:  Maximum rate per volume.
+        """
+        self._rate = bytes_per_second
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def callback(self, volume_keys):
+        """
+        :volume_keys:   Keys of the volumes one copy reads from and writes to.
+
+        :returns:       A progress callback for the copy, to be given the
+                        number of bytes written after each chunk.
+        """
+        with self._lock:
+            buckets = []
+            for key in set(volume_keys):
+                if key not in self._buckets:
+                    self._buckets[key] = TokenBucket(self._rate)
+                buckets.append(self._buckets[key])
+
+        def throttle(num_bytes):
+            for bucket in buckets:
+                bucket.consume(num_bytes)
+        return throttle
+
+
+def lower_thread_priority():
+    """
+    Lowers the CPU and I/O priority of the calling thread, on a best effort
+    basis, so copy workers yield to the DCC and to other processes.
+
+    :returns:   True if the priority could be lowered.
+    """
+    try:
+        import ctypes
+        import ctypes.util
+    except ImportError:
+        return False
+
+    try:
+        if sys.platform == "win32":
+            # lowers both the CPU and I/O priority of the thread
+            THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+            kernel32 = ctypes.windll.kernel32
+            return bool(kernel32.SetThreadPriority(kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN))
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if sys.platform == "darwin":
+            IOPOL_TYPE_DISK, IOPOL_SCOPE_THREAD, IOPOL_THROTTLE = 0, 1, 3
+            return libc.setiopolicy_np(IOPOL_TYPE_DISK, IOPOL_SCOPE_THREAD, IOPOL_THROTTLE) == 0
+
+        if sys.platform.startswith("linux"):
+            # syscall numbers of gettid and ioprio_set
+            syscalls = {"x86_64": (186, 251), "aarch64": (178, 30), "i686": (224, 289)}.get(platform.machine())
+            if syscalls is None:
+                return False
+            gettid, ioprio_set = syscalls
+            thread_id = libc.syscall(gettid)
+            # on Linux the nice value of a thread id only applies to that thread
+            PRIO_PROCESS = 0
+            niced = libc.setpriority(PRIO_PROCESS, thread_id, 10) == 0
+            # lowest best effort I/O priority; the idle class could starve
+            # the copy for as long as anything else is using the disk
+            IOPRIO_WHO_PROCESS, IOPRIO_CLASS_BE, IOPRIO_CLASS_SHIFT = 1, 2, 13
+            lowered = libc.syscall(ioprio_set, IOPRIO_WHO_PROCESS, thread_id,
+                                   (IOPRIO_CLASS_BE << IOPRIO_CLASS_SHIFT) | 7) == 0
+            return niced or lowered
+    except (OSError, AttributeError):
+        pass
+    return False
@@ -0,0 +1,166 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import json
+import errno
+import threading
+
+from .plan import normalize_path
+
+# journal events, in the order a file goes through them
+PLANNED = "planned"
+STARTED = "started"
+DONE = "done"
+
+
+class CollectionJournal(object):
+    """
+    Append-only log of the file copies of a collection that is in progress.
+
+    Every planned, started and finished copy is written out as one line of
+    JSON as it happens, so if the DCC dies part way through a collection the
+    next run can tell which files were finished and which were interrupted
+    and can be resumed from their partial target. The journal is removed once
+    a collection completes without leaving anything unfinished.
+    """
+
+    def __init__(self, path):
+        """
+        Constructor
+
+        :path:  Path of the journal file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        # normalized source -> latest entry for files that didn't finish
+        self._unfinished = {}
+
+    def recover(self, manifest):
+        """
+        Reads the journal left behind by an interrupted collection, if any.
+
+        Files it lists as done are added to 'manifest' so they are skipped,
+        and files that were started but not finished are remembered so that
+        can_resume() can tell their partial copy is still good.
+        """
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                lines = f.readlines()
+        except (IOError, OSError):
+            return
+
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # the last line may have been cut short by the crash
+                continue
+            key = normalize_path(entry["source"])
+            if entry["event"] == DONE:
+                self._unfinished.pop(key, None)
+                manifest.record(entry["source"], entry["size"], entry["mtime"], entry["target"])
+            elif entry["event"] == STARTED:
+                self._unfinished[key] = entry
+
+    def can_resume(self, source, size, mtime, target):
+        """
+        :returns:   True if a previous collection was interrupted while copying
+                    this exact source to this target, so the partial copy it
+                    left behind can be continued.
+        """
+        entry = self._unfinished.get(normalize_path(source))
+        if entry is None:
+            return False
+        return (entry["size"] == size and entry["mtime"] == mtime
+                and normalize_path(entry["target"]) == normalize_path(target))
+
+    def open(self):
+        """
+        Starts a new journal for this collection. Unfinished copies recovered
+        from the previous one are carried over, so they can still be resumed
+        if this collection is interrupted before it gets to them.
+        """
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        with self._lock:
+            self._file = open(self.path, "w")
+            for entry in self._unfinished.values():
+                self._write(entry)
+            self._file.flush()
+
+    def planned(self, planned_files):
+        """
+        Records the files that this collection is going to copy.
+        """
+        with self._lock:
+            for planned in planned_files:
+                self._write(self._entry(PLANNED, planned))
+            self._file.flush()
+
+    def started(self, planned):
+        """
+        Records that the copy of a file has started.
+        """
+        self._log(self._entry(STARTED, planned))
+
+    def done(self, planned):
+        """
+        Records that a file has been completely copied to its target.
+        """
+        self._log(self._entry(DONE, planned))
+
+    def close(self):
+        """
+        Ends the journal. If no copies were left unfinished the file is
+        removed, otherwise it is rewritten to only list those.
+        """
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.close()
+            self._file = None
+            if not self._unfinished:
+                try:
+                    os.remove(self.path)
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+                return
+            with open(self.path, "w") as f:
+                for entry in self._unfinished.values():
+                    f.write(json.dumps(entry) + "\n")
+
+    def _entry(self, event, planned):
+        return {"event": event,
+                "source": planned.source,
+                "target": planned.target,
+                "size": planned.size,
+                "mtime": planned.mtime,
+                }
+
+    def _log(self, entry):
+        key = normalize_path(entry["source"])
+        with self._lock:
+            if entry["event"] == STARTED:
+                self._unfinished[key] = entry
+            else:
+                self._unfinished.pop(key, None)
+            if self._file is None:
+                return
+            self._write(entry)
+            self._file.flush()
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry) + "\n")
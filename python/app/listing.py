@@ -0,0 +1,140 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import threading
+from stat import S_ISREG
+
+from .plan import normalize_path
+
+# Largest difference, in seconds, between the modification times of a source
+# and a copy of it that are still taken as the same. Python 2's
+# shutil.copystat only sets them to the microsecond.
+MTIME_TOLERANCE = 1e-3
+
+
+def is_unchanged_copy(source_stat, target_stat):
+    """
+    :returns:   True if a target whose (size, mtime) tuple is 'target_stat'
+                looks like an unchanged copy of a source whose tuple is
+                'source_stat': the same size, and the same modification time
+                to within MTIME_TOLERANCE.
+    """
+    return source_stat[0] == target_stat[0] and abs(source_stat[1] - target_stat[1]) < MTIME_TOLERANCE
+
+
+class DirectoryCache(object):
+    """
+    Caches directory listings for the length of one scan or collection.
+
+    Listing a folder on a network filer is a round trip per call, and a
+    scene often has many objects reading from the same folder, so each folder
+    is listed once and every later lookup is answered from memory.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._lock = threading.Lock()
+        self._listings = {}
+        self._stats = {}
+
+    def names(self, folder):
+        """
+        :returns:   Frozenset of the names of the files in 'folder', empty if
+                    the folder doesn't exist or can't be read.
+        """
+        key = normalize_path(folder)
+        with self._lock:
+            names = self._listings.get(key)
+        if names is None:
+            names = self._list(folder)
+            with self._lock:
+                self._listings[key] = names
+        return names
+
+    def stats(self, folder):
+        """
+        :returns:   Dictionary mapping the name of each file in 'folder',
+                    normalized with os.path.normcase, to a (size, mtime)
+                    tuple. Empty if the folder doesn't exist or can't be
+                    read.
+        """
+        key = normalize_path(folder)
+        with self._lock:
+            stats = self._stats.get(key)
+        if stats is None:
+            names, stats = self._list_stats(folder)
+            with self._lock:
+                self._stats[key] = stats
+                self._listings[key] = names
+        return stats
+
+    def stat(self, path):
+        """
+        :returns:   (size, mtime) tuple for the file 'path', or None if it
+                    doesn't exist. Lists the whole folder on first use. On
+                    Windows the name is matched whatever its case, as the
+                    filesystem does.
+        """
+        folder, name = os.path.split(path)
+        return self.stats(folder).get(os.path.normcase(name))
+
+    def _list(self, folder):
+        """
+        Lists the files in 'folder'. Uses os.scandir where available, which
+        can tell files from folders without a stat call per entry.
+        """
+        scandir = getattr(os, "scandir", None)
+        try:
+            if scandir is None:
+                return frozenset(os.listdir(folder))
+            return frozenset(entry.name for entry in scandir(folder) if entry.is_file())
+        except OSError:
+            return frozenset()
+
+    def _list_stats(self, folder):
+        """
+        Lists the files in 'folder' along with their size and modification
+        time. On Windows os.scandir gets these from the listing itself, and
+        NFS clients usually return them with the listing too.
+
+        :returns:   Tuple (names, stats) of a frozenset of the file names as
+                    they are on disk, and the stats dictionary returned by
+                    stats().
+        """
+        names = []
+        stats = {}
+        scandir = getattr(os, "scandir", None)
+        try:
+            if scandir is None:
+                for name in os.listdir(folder):
+                    try:
+                        stat = os.stat(os.path.join(folder, name))
+                    except OSError:
+                        # e.g. a broken link
+                        continue
+                    if S_ISREG(stat.st_mode):
+                        names.append(name)
+                        stats[os.path.normcase(name)] = (stat.st_size, stat.st_mtime)
+            else:
+                for entry in scandir(folder):
+                    try:
+                        if not entry.is_file():
+                            continue
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    names.append(entry.name)
+                    stats[os.path.normcase(entry.name)] = (stat.st_size, stat.st_mtime)
+        except OSError:
+            pass
+        return frozenset(names), stats
@@ -0,0 +1,186 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import json
+import time
+import errno
+import threading
+import contextlib
+
+from .plan import normalize_path
+
+# Seconds after which a lock file is taken to be left over by a process that
+# died while holding it.
+STALE_LOCK_AGE = 60.0
+
+
+def write_json(path, data):
+    """
+    Writes 'data' as JSON to a temporary file next to 'path' and then moves
+    it into place, so a crash never leaves a half written file behind.
+    """
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    # unique to the process and thread, so concurrent writers don't share it
+    temp_path = "%s.%d.%d.tmp" % (path, os.getpid(), threading.current_thread().ident)
+    with open(temp_path, "w") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+    if os.name == "nt":
+        # os.rename won't replace an existing file on Windows
+        try:
+            os.remove(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+    os.rename(temp_path, path)
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """
+    Holds a lock on 'path' across processes for the length of the with block,
+    by creating 'path'.lock exclusively. A lock file older than
+    STALE_LOCK_AGE is removed rather than waited on.
+    """
+    lock_path = path + ".lock"
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        try:
+            if time.time() - os.path.getmtime(lock_path) > STALE_LOCK_AGE:
+                os.remove(lock_path)
+                continue
+        except OSError:
+            # released in the meantime
+            continue
+        time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+class CollectionManifest(object):
+    """
+    Record of the files that have been collected into the project.
+
+    For every source file it stores the size and modification time the file
+    had when it was copied, the target it was copied to and, if the copy was
+    verified, the checksum of its data as "<algorithm>:<hex digest>". When a
+    later collection finds the same source unchanged and the target still
+    there, the file can be skipped without reading it again.
+
+    Several collections can share a manifest, e.g. batch runs of different
+    scenes at the same time, so save() merges the records of this one into
+    whatever is on disk by then rather than writing over it.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path):
+        """
+        Constructor
+
+        :path:  Path of the manifest file. It is created on save() if it
+                doesn't exist yet.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._files = self._read()
+        # keys of the records added since the manifest was read or saved
+        self._changed = set()
+
+    def _read(self):
+        """
+        :returns:   The records of the manifest on disk, by normalized source.
+        """
+        if not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            # a corrupt manifest just means everything gets checked again
+            return {}
+        if data.get("version") != self.VERSION:
+            return {}
+        return data.get("files", {})
+
+    def get(self, source):
+        """
+        :returns:   The record for 'source' as a dictionary with 'source',
+                    'size', 'mtime' and 'target' keys, and 'checksum' for
+                    verified copies, or None.
+        """
+        with self._lock:
+            return self._files.get(normalize_path(source))
+
+    def is_current(self, source, size, mtime, target, target_size):
+        """
+        :source:        Source file path.
+        :size:          Current size of the source file.
+        :mtime:         Current modification time of the source file.
+        :target:        Target the source would be copied to.
+        :target_size:   Current size of the target file, or None if it
+                        doesn't exist.
+
+        :returns:   True if the source was already collected to 'target' and
+                    neither file has changed since.
+        """
+        record = self.get(source)
+        if record is None or target_size is None:
+            return False
+        return (record["size"] == size and record["mtime"] == mtime and target_size == size
+                and normalize_path(record["target"]) == normalize_path(target))
+
+    def record(self, source, size, mtime, target, **extra):
+        """
+        Records that 'source' with the given size and modification time was
+        collected to 'target'. Any extra keyword arguments are stored with it.
+        """
+        entry = {"source": source, "size": size, "mtime": mtime, "target": target}
+        entry.update(extra)
+        key = normalize_path(source)
+        with self._lock:
+            self._files[key] = entry
+            self._changed.add(key)
+
+    def save(self):
+        """
+        Writes the manifest to disk if anything changed, merged with the
+        records other collections saved since it was read.
+        """
+        with self._lock:
+            if not self._changed:
+                return
+            folder = os.path.dirname(self.path)
+            if folder and not os.path.isdir(folder):
+                try:
+                    os.makedirs(folder)
+                except OSError as e:
+                    if e.errno != errno.EEXIST:
+                        raise
+            with file_lock(self.path):
+                files = self._read()
+                for key in self._changed:
+                    files[key] = self._files[key]
+                write_json(self.path, {"version": self.VERSION, "files": files})
+            self._files = files
+            self._changed = set()
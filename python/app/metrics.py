@@ -0,0 +1,156 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import threading
+import traceback
+import time
+from contextlib import contextmanager
+
+
+def percentile(ordered, fraction):
+    """
+    :ordered:   Sorted list of numbers, not empty.
+    :fraction:  Percentile wanted, between 0 and 1.
+
+    :returns:   The nearest rank percentile of 'ordered'.
+    """
+    index = int(round(fraction * (len(ordered) - 1)))
+    return ordered[max(0, min(len(ordered) - 1, index))]
+
+
+class CollectionMetrics(object):
+    """
+    Thread safe record of where the time of one collection went.
+
+    Phases are timed on whichever thread runs them, and the copy workers
+    record every file they finish or fail. report() turns it all into a
+    dictionary that can be written out as JSON.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._lock = threading.Lock()
+        self._created = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self._phases = {}
+        self._latencies = []
+        self._volumes = {}
+        self._failures = []
+        self._files = {"copied": 0, "up_to_date": 0, "declined": 0, "failed": 0}
+        self._bytes = {"copied": 0, "up_to_date": 0, "declined": 0}
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Times the body of a with block as phase 'name'. A phase that runs
+        more than once adds up.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - start
+            with self._lock:
+                self._phases[name] = self._phases.get(name, 0.0) + seconds
+
+    def file_copied(self, volume, size, start, end):
+        """
+        Records a file copied between the times 'start' and 'end'.
+
+        :volume:    Key of the volume the file was copied from, as
+                    CopyEngine.volume_of returns, so the workers don't have
+                    to look it up on the filesystem again.
+        """
+        key = str(volume)
+        with self._lock:
+            self._files["copied"] += 1
+            self._bytes["copied"] += size or 0
+            self._latencies.append(end - start)
+            volume = self._volumes.get(key)
+            if volume is None:
+                volume = self._volumes[key] = {"files": 0, "bytes": 0, "start": start, "end": end}
+            volume["files"] += 1
+            volume["bytes"] += size or 0
+            volume["start"] = min(volume["start"], start)
+            volume["end"] = max(volume["end"], end)
+
+    def file_skipped(self, size, reason):
+        """
+        Records a file that wasn't copied, because it was 'up_to_date' or
+        because the user 'declined' to overwrite it.
+        """
+        with self._lock:
+            self._files[reason] += 1
+            self._bytes[reason] += size or 0
+
+    def file_failed(self, source, target, exc_info):
+        """
+        Records a file that failed to copy, along with the exception raised.
+
+        :exc_info:  Tuple as returned by sys.exc_info().
+        """
+        failure = {"source": source,
+                   "target": target,
+                   "type": exc_info[0].__name__,
+                   "message": str(exc_info[1]),
+                   "traceback": "".join(traceback.format_exception(*exc_info)),
+                   }
+        with self._lock:
+            self._files["failed"] += 1
+            self._failures.append(failure)
+
+    def report(self, references_scanned, updated_count, tasks, scene_path=None, cancelled=False):
+        """
+        :references_scanned:    Number of references found by the scan hook.
+        :updated_count:         Number of objects whose references were updated.
+        :tasks:                 Task list, after the update hook has run.
+        :scene_path:            Path of the work file, if it has been saved.
+        :cancelled:             Whether the user cancelled the collection.
+
+        :returns:   Dictionary that can be written out as JSON.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            latency = {"count": len(latencies)}
+            if latencies:
+                latency.update({"mean": sum(latencies) / len(latencies),
+                                "p50": percentile(latencies, 0.5),
+                                "p90": percentile(latencies, 0.9),
+                                "p99": percentile(latencies, 0.99),
+                                "max": latencies[-1],
+                                })
+
+            source_volumes = {}
+            for key, volume in self._volumes.items():
+                # copies run concurrently, so throughput is measured over the
+                # time the volume was busy rather than the sum of the copies
+                seconds = volume["end"] - volume["start"]
+                source_volumes[key] = {"files": volume["files"],
+                                       "bytes": volume["bytes"],
+                                       "seconds": seconds,
+                                       "mb_per_second": volume["bytes"] / (1024.0 ** 2) / seconds if seconds else None,
+                                       }
+
+            return {"created": self._created,
+                    "scene_path": scene_path,
+                    "cancelled": cancelled,
+                    "references_scanned": references_scanned,
+                    "objects": len(tasks),
+                    "updated": updated_count,
+                    "phases": dict(self._phases),
+                    "files": dict(self._files),
+                    "bytes": dict(self._bytes),
+                    "latency": latency,
+                    "source_volumes": source_volumes,
+                    "failures": list(self._failures),
+                    "object_errors": dict((task["name"], task.get("error_message"))
+                                          for task in tasks if task.get("error") or task.get("error_message")),
+                    }
@@ -0,0 +1,479 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+from array import array
+from bisect import bisect_left
+
+try:
+    from itertools import izip as zip_lazy
+except ImportError:
+    zip_lazy = zip
+
+from .sequences import SequenceFiles, SequencePattern
+
+# bits of PlannedGroup.flags
+_COPY = 1
+_UP_TO_DATE = 2
+_RESUME = 4
+
+# size or modification time that isn't known yet
+_UNKNOWN = float("nan")
+
+
+def normalize_path(path):
+    """
+    Returns 'path' in a form that can be used to compare it with other paths.
+    """
+    return os.path.normcase(os.path.normpath(path.replace("\\", "/")))
+
+
+def _flag(bit):
+    """
+    Returns a property reading and writing 'bit' of a PlannedFile's flags.
+    """
+    def get(self):
+        return bool(self.group.flags[self.index] & bit)
+
+    def set(self, value):
+        if value:
+            self.group.flags[self.index] |= bit
+        else:
+            self.group.flags[self.index] &= ~bit
+    return property(get, set)
+
+
+class PlannedFile(object):
+    """
+    A unique source file and the single target it will be copied to.
+
+    The plan doesn't keep a PlannedFile per file, it's only a view of one
+    file of a PlannedGroup, made whenever one is needed. Two PlannedFiles of
+    the same file are equal and hash the same, so either can be used as a
+    key. Paths are built from the task's file lists each time they are read.
+    """
+    __slots__ = ("group", "index")
+
+    def __init__(self, group, index):
+        """
+        Constructor
+
+        :group:     PlannedGroup the file belongs to.
+        :index:     Index of the file in the group.
+        """
+        self.group = group
+        self.index = index
+
+    def __repr__(self):
+        return "<PlannedFile %s -> %s>" % (self.source, self.target)
+
+    def __eq__(self, other):
+        return isinstance(other, PlannedFile) and other.group is self.group and other.index == self.index
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self.group), self.index))
+
+    @property
+    def source(self):
+        return self.group.sources[self.group.position(self.index)]
+
+    @property
+    def target(self):
+        return self.group.targets[self.group.position(self.index)]
+
+    @property
+    def task_indices(self):
+        """
+        Tuple of the indices of every task that needs this file.
+        """
+        return self.group.plan._task_sets[self.group.task_sets[self.index]]
+
+    # False if the user chose not to overwrite an existing target
+    copy = _flag(_COPY)
+    # True if the target is already an unchanged copy of the source
+    up_to_date = _flag(_UP_TO_DATE)
+    # True if an interrupted collection left a partial copy to continue
+    resume = _flag(_RESUME)
+
+    @property
+    def size(self):
+        """
+        Size of the source, if known.
+        """
+        size = self.group.sizes[self.index]
+        if size != size:
+            return None
+        return int(size)
+
+    @size.setter
+    def size(self, size):
+        self.group.sizes[self.index] = _UNKNOWN if size is None else size
+
+    @property
+    def mtime(self):
+        """
+        Modification time of the source, if known.
+        """
+        mtime = self.group.mtimes[self.index]
+        if mtime != mtime:
+            return None
+        return mtime
+
+    @mtime.setter
+    def mtime(self, mtime):
+        self.group.mtimes[self.index] = _UNKNOWN if mtime is None else mtime
+
+
+class PlannedGroup(object):
+    """
+    The files a task added to the plan.
+
+    The group holds on to the task's own source and target lists, so an image
+    sequence stays a sequences.SequenceFiles, and keeps what the plan knows
+    about each file in arrays rather than in an object per file.
+    """
+    __slots__ = ("plan", "sources", "targets", "positions", "task_sets", "flags", "sizes", "mtimes")
+
+    def __init__(self, plan, sources, targets):
+        """
+        Constructor
+
+        :plan:      CollectionPlan the group belongs to.
+        :sources:   The task's source files.
+        :targets:   The task's target files, as they were before the plan
+                    redirected any of them.
+        """
+        self.plan = plan
+        self.sources = sources
+        self.targets = targets
+        # position of each file in sources and targets, None once sealed if
+        # they are the first positions, in order
+        self.positions = array("l")
+        # index of each file's tuple of task indices in the plan's table of them
+        self.task_sets = array("l")
+        self.flags = bytearray()
+        self.sizes = array("d")
+        self.mtimes = array("d")
+
+    def __len__(self):
+        return len(self.flags)
+
+    def append(self, position, task_set):
+        """
+        Adds the file at 'position' in the task's lists.
+
+        :returns:   The new PlannedFile.
+        """
+        self.positions.append(position)
+        self.task_sets.append(task_set)
+        self.flags.append(_COPY)
+        self.sizes.append(_UNKNOWN)
+        self.mtimes.append(_UNKNOWN)
+        return PlannedFile(self, len(self.flags) - 1)
+
+    def seal(self):
+        """
+        Drops the positions once every file has been added, if the files are
+        simply the first ones of the task's lists.
+        """
+        if self.positions and self.positions[-1] == len(self.positions) - 1:
+            self.positions = None
+
+    def position(self, index):
+        """
+        :returns:   Position in the task's lists of the file at 'index'.
+        """
+        if self.positions is None:
+            return index
+        return self.positions[index]
+
+    def index(self, position):
+        """
+        :returns:   Index of the file at 'position' in the task's lists, or
+                    None if the group doesn't have it.
+        """
+        if self.positions is None:
+            return position if 0 <= position < len(self) else None
+        index = bisect_left(self.positions, position)
+        if index < len(self.positions) and self.positions[index] == position:
+            return index
+        return None
+
+
+class _PathIndex(object):
+    """
+    Finds the planned files a path belongs to, on the source or the target
+    side of the plan. The files of an image sequence are indexed once as a
+    pattern and looked up by frame, rather than one by one.
+    """
+
+    def __init__(self, plan, side):
+        """
+        Constructor
+
+        :plan:  The CollectionPlan, for its normalized folders.
+        :side:  "sources" or "targets", the PlannedGroup lists to index.
+        """
+        self._plan = plan
+        self._side = side
+        # (normalized folder, normalized name) -> PlannedFiles at that path
+        self._names = {}
+        # normalized folder -> (pattern, PlannedGroup) tuples, the pattern
+        # matching normalized names
+        self._sequences = {}
+        self._sequence_groups = set()
+
+    def add(self, planned, path):
+        """
+        Indexes a file just added to the plan, at 'path' on this side.
+        """
+        group = planned.group
+        if group in self._sequence_groups:
+            return
+        files = getattr(group, self._side)
+        if planned.index == 0 and isinstance(files, SequenceFiles) and _increasing(files.frames):
+            pattern = files.pattern
+            pattern = SequencePattern(os.path.normcase(pattern.prefix), os.path.normcase(pattern.suffix),
+                                      pattern.padding)
+            self._sequences.setdefault(self._plan._folder_key(files.folder), []).append((pattern, group))
+            self._sequence_groups.add(group)
+            return
+        self._names.setdefault(self._plan._path_key(path), []).append(planned)
+
+    def find(self, path):
+        """
+        :returns:   List of the planned files at 'path'.
+        """
+        folder_key, name_key = key = self._plan._path_key(path)
+        found = list(self._names.get(key, ()))
+        for pattern, group in self._sequences.get(folder_key, ()):
+            frame = pattern.match(name_key)
+            if frame is None:
+                continue
+            frames = getattr(group, self._side).frames
+            position = bisect_left(frames, frame)
+            if position < len(frames) and frames[position] == frame:
+                index = group.index(position)
+                if index is not None:
+                    found.append(PlannedFile(group, index))
+        return found
+
+
+def _increasing(frames):
+    """
+    :returns:   True if every frame is greater than the one before it.
+    """
+    return all(previous < frame for previous, frame in zip_lazy(frames, frames[1:]))
+
+
+class CollectionPlan(object):
+    """
+    Index of every source file across all tasks.
+
+    Several scene objects often reference the same files, e.g. a plate read in
+    by more than one Read node. The plan makes sure each unique source is
+    copied once and points every task that needs it at that single copy.
+
+    It also makes sure no two sources are copied to the same target, e.g.
+    plates of two shots with the same file names collected into one folder.
+    The copies would run at the same time and write over each other, so the
+    task of the second source is flagged with an error instead, and its
+    references are left alone.
+
+    Files are kept per task, as a PlannedGroup, so a 10,000 frame sequence
+    costs a few arrays rather than 10,000 objects and paths.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._groups = []
+        self._count = 0
+        self._sources = _PathIndex(self, "sources")
+        self._targets = _PathIndex(self, "targets")
+        # every distinct tuple of task indices, shared by the files that
+        # have it, and the index of each in the list
+        self._task_sets = []
+        self._task_set_indices = {}
+        # normalized form of each folder, shared by all of its files
+        self._folders = {}
+
+    def __len__(self):
+        return self._count
+
+    def files(self):
+        """
+        :returns:   List of every PlannedFile, in the order they were added.
+        """
+        return [PlannedFile(group, i) for group in self._groups for i in range(len(group))]
+
+    def add_task(self, index, task, planned_files=None):
+        """
+        Adds the files of a task to the plan.
+
+        If a source file is already planned with a target of the same name,
+        the task's target is changed to that existing copy, and its
+        'new_filename' is moved along with it, as long as all of its files
+        end up in the same folder. If only some of them would, e.g. two Read
+        nodes with overlapping frame ranges collected into different folders,
+        the shared files are copied to the task's own targets as well, so its
+        folder is complete.
+
+        The task's file lists are only walked, never copied, so a task can
+        hold them as sequences.SequenceFiles. A SequenceFiles whose targets
+        all move to the same folder stays one; any other redirection turns
+        the targets into a list.
+
+        :index:     Index of the task in the task list.
+        :task:      Task dictionary as returned by the scan scene hook.
+        :planned_files: Optional list, every PlannedFile the task needs is
+                        appended to it, whether new or not.
+
+        A file whose target is already planned for another source isn't
+        added. The task's 'error' is set and its 'error_message' names both
+        sources.
+
+        :returns:   List of the PlannedFiles that were new to the plan.
+        """
+        new_files = []
+        redirected_folders = set()
+        # position -> (PlannedFile, its target, source, target, task set of
+        # the PlannedFile before this task, index in planned_files)
+        redirected = {}
+        target_files = task["target_files"]
+        group = PlannedGroup(self, task["source_files"], target_files)
+        task_set = self._task_set_index((index,))
+        for j, (source, target) in enumerate(zip_lazy(group.sources, target_files)):
+            planned = self._find(source, target)
+            if planned is None:
+                planned = self._add_file(task, group, j, source, target, task_set, new_files)
+                if planned is None:
+                    continue
+                redirected_folders.add(None)
+            else:
+                planned_target = planned.target
+                old_task_set = planned.group.task_sets[planned.index]
+                task_indices = planned.task_indices
+                if index not in task_indices:
+                    planned.group.task_sets[planned.index] = self._task_set_index(task_indices + (index,))
+                if planned_target != target and self._path_key(planned_target) != self._path_key(target):
+                    redirected[j] = (planned, planned_target, source, target, old_task_set,
+                                     len(planned_files) if planned_files is not None else None)
+                    redirected_folders.add(os.path.dirname(planned_target))
+                else:
+                    redirected_folders.add(None)
+            if planned_files is not None:
+                planned_files.append(planned)
+        self._keep_group(group)
+
+        moved = len(redirected_folders) == 1 and None not in redirected_folders
+        if redirected and not moved:
+            # only part of the task would end up in another folder, copy the
+            # shared files to its own targets rather than redirect them
+            copies = PlannedGroup(self, task["source_files"], target_files)
+            for j in sorted(redirected, reverse=True):
+                planned, planned_target, source, target, old_task_set, slot = redirected[j]
+                planned.group.task_sets[planned.index] = old_task_set
+            for j in sorted(redirected):
+                planned, planned_target, source, target, old_task_set, slot = redirected[j]
+                copy = self._add_file(task, copies, j, source, target, task_set, new_files)
+                if copy is not None and slot is not None:
+                    planned_files[slot] = copy
+            self._keep_group(copies)
+            redirected = {}
+
+        if redirected:
+            if moved and hasattr(target_files, "with_folder"):
+                # the whole sequence is already planned in another folder
+                task["target_files"] = target_files.with_folder(list(redirected_folders)[0])
+            else:
+                task["target_files"] = [redirected[j][1] if j in redirected else target
+                                        for j, target in enumerate(target_files)]
+            other_params = task.get("other_params") or {}
+            if "new_filename" in other_params:
+                other_params["new_filename"] = os.path.join(redirected_folders.pop(),
+                                                            os.path.basename(other_params["new_filename"]))
+        return new_files
+
+    def _add_file(self, task, group, position, source, target, task_set, new_files):
+        """
+        Adds the file at 'position' of a task to 'group', and to 'new_files',
+        unless its target is already planned for another source, in which
+        case the task is flagged.
+
+        :returns:   The new PlannedFile, or None.
+        """
+        claimed = self._targets.find(target)
+        if claimed:
+            if not task.get("error"):
+                task["error"] = True
+                task["error_message"] = ("Target %s is already collected from %s, not copying %s over it."
+                                         % (target, claimed[0].source, source))
+            return None
+        planned = group.append(position, task_set)
+        self._sources.add(planned, source)
+        self._targets.add(planned, target)
+        new_files.append(planned)
+        return planned
+
+    def _keep_group(self, group):
+        """
+        Adds a group filled by add_task to the plan, if it has any files.
+        """
+        if len(group):
+            group.seal()
+            self._groups.append(group)
+            self._count += len(group)
+
+    def _find(self, source, target):
+        """
+        Returns the PlannedFile copying 'source' to 'target', or else to a
+        target with the same name as 'target', or None.
+        """
+        name = os.path.basename(target)
+        found = None
+        for planned in self._sources.find(source):
+            planned_target = planned.target
+            if planned_target == target:
+                return planned
+            if found is None and os.path.basename(planned_target) == name:
+                found = planned
+        return found
+
+    def _task_set_index(self, task_indices):
+        """
+        Returns the index of the tuple 'task_indices' in the plan's table of
+        them, adding it if it's new.
+        """
+        task_set = self._task_set_indices.get(task_indices)
+        if task_set is None:
+            task_set = self._task_set_indices[task_indices] = len(self._task_sets)
+            self._task_sets.append(task_indices)
+        return task_set
+
+    def _folder_key(self, folder):
+        """
+        Returns the normalized form of 'folder'.
+        """
+        folder_key = self._folders.get(folder)
+        if folder_key is None:
+            folder_key = self._folders[folder] = normalize_path(folder)
+        return folder_key
+
+    def _path_key(self, path):
+        """
+        Returns a (normalized folder, normalized name) tuple for 'path'.
+        """
+        folder, name = os.path.split(path)
+        return self._folder_key(folder), os.path.normcase(name)
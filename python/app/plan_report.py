@@ -0,0 +1,113 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import time
+
+from .copy_engine import volume_key
+
+
+def free_space(path):
+    """
+    Returns the number of bytes available to the current user on the volume
+    'path' would be written to, or None if it can't be determined. 'path'
+    doesn't have to exist yet.
+    """
+    folder = path
+    while folder and not os.path.isdir(folder):
+        parent = os.path.dirname(folder)
+        if parent == folder:
+            break
+        folder = parent
+
+    if hasattr(os, "statvfs"):
+        try:
+            stat = os.statvfs(folder)
+        except OSError:
+            return None
+        return stat.f_bavail * stat.f_frsize
+
+    if os.name == "nt":
+        import ctypes
+        free_bytes = ctypes.c_ulonglong(0)
+        if ctypes.windll.kernel32.GetDiskFreeSpaceExW(ctypes.c_wchar_p(folder), ctypes.byref(free_bytes),
+                                                      None, None):
+            return free_bytes.value
+    return None
+
+
+def build_report(references_scanned, tasks, plan, stat):
+    """
+    Describes what a collection would do, without doing any of it.
+
+    :references_scanned:    Number of references found by the scan hook.
+    :tasks:                 Task list returned by the scan hook.
+    :plan:                  CollectionPlan built from the tasks, with the
+                            up to date state of its files already checked.
+    :stat:                  Callable returning (size, mtime) or None for a path.
+
+    :returns:   Dictionary that can be written out as JSON.
+    """
+    summary = {"files": 0, "bytes": 0,
+               "up_to_date_files": 0, "up_to_date_bytes": 0,
+               "missing_files": 0}
+    source_volumes = {}
+    target_volumes = {}
+    conflicts = []
+    missing = []
+
+    for planned in plan.files():
+        task_names = sorted(set(tasks[i]["name"] for i in planned.task_indices))
+        source_stat = stat(planned.source)
+        if source_stat is None:
+            summary["missing_files"] += 1
+            missing.append({"source": planned.source, "objects": task_names})
+            continue
+        size = source_stat[0]
+
+        if planned.up_to_date:
+            summary["up_to_date_files"] += 1
+            summary["up_to_date_bytes"] += size
+            continue
+
+        summary["files"] += 1
+        summary["bytes"] += size
+
+        volume = source_volumes.setdefault(str(volume_key(planned.source)), {"files": 0, "bytes": 0})
+        volume["files"] += 1
+        volume["bytes"] += size
+
+        target_key = str(volume_key(planned.target))
+        volume = target_volumes.setdefault(target_key, {"files": 0, "bytes": 0, "example_path": planned.target})
+        volume["files"] += 1
+        volume["bytes"] += size
+
+        if stat(planned.target) is not None:
+            conflicts.append({"source": planned.source, "target": planned.target, "objects": task_names})
+
+    for volume in target_volumes.values():
+        volume["free_bytes"] = free_space(os.path.dirname(volume.pop("example_path")))
+        volume["fits"] = volume["free_bytes"] is None or volume["bytes"] <= volume["free_bytes"]
+
+    return {"created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "references_scanned": references_scanned,
+            "objects": len(tasks),
+            "summary": summary,
+            "source_volumes": source_volumes,
+            "target_volumes": target_volumes,
+            "conflicts": conflicts,
+            "missing": missing,
+            "tasks": [{"name": task["name"],
+                       "type": task["type"],
+                       "files": len(task["source_files"]),
+                       "new_filename": (task.get("other_params") or {}).get("new_filename"),
+                       "error": task.get("error_message"),
+                       } for task in tasks],
+            }
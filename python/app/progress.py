@@ -0,0 +1,131 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import threading
+import time
+
+
+class CollectionCancelled(Exception):
+    """
+    Raised inside a copy when the user has asked to cancel the collection.
+    """
+
+
+class CollectionProgress(object):
+    """
+    Thread safe counters describing how far along a collection is.
+
+    Copy workers report into it as data moves and the progress widget polls
+    snapshot() from the main thread, so no Qt objects are touched from the
+    worker threads.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._start_time = None
+        self.total_files = 0
+        self.total_bytes = 0
+        self.done_files = 0
+        self.done_bytes = 0
+        self.status = "Scanning scene..."
+        self.finished = False
+
+    def start(self):
+        """
+        Marks the moment copying started, used for throughput and ETA.
+        """
+        with self._lock:
+            self._start_time = time.time()
+            self.status = "Copying files..."
+
+    def add_total(self, files, num_bytes):
+        """
+        Adds files and bytes to the amount of work expected.
+        """
+        with self._lock:
+            self.total_files += files
+            self.total_bytes += num_bytes
+
+    def add_bytes(self, num_bytes):
+        """
+        Records bytes written for a file that is still being copied.
+        """
+        with self._lock:
+            self.done_bytes += num_bytes
+
+    def file_done(self, num_bytes=0):
+        """
+        Records a finished (or skipped) file, along with any of its bytes
+        that weren't already reported through add_bytes().
+        """
+        with self._lock:
+            self.done_files += 1
+            self.done_bytes += num_bytes
+
+    def set_status(self, status, finished=False):
+        """
+        Sets the message shown to the user.
+        """
+        with self._lock:
+            self.status = status
+            self.finished = self.finished or finished
+
+    def cancel(self):
+        """
+        Asks the collection to stop as soon as possible.
+        """
+        self._cancel.set()
+        self.set_status("Cancelling...")
+
+    def is_cancelled(self):
+        """
+        :returns:   True if cancel() has been called.
+        """
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        """
+        Raises CollectionCancelled if cancel() has been called. Safe to call
+        from any thread as often as needed.
+        """
+        if self._cancel.is_set():
+            raise CollectionCancelled("Collection was cancelled.")
+
+    def snapshot(self):
+        """
+        :returns:   Dictionary with the current counters plus the elapsed time,
+                    throughput in bytes per second and the estimated seconds
+                    remaining (None until it can be estimated).
+        """
+        with self._lock:
+            elapsed = 0.0
+            if self._start_time is not None:
+                elapsed = time.time() - self._start_time
+            throughput = 0.0
+            if elapsed > 0:
+                throughput = self.done_bytes / elapsed
+            eta = None
+            if throughput > 0 and self.total_bytes:
+                eta = max(0.0, (self.total_bytes - self.done_bytes) / throughput)
+            return {"total_files": self.total_files,
+                    "total_bytes": self.total_bytes,
+                    "done_files": self.done_files,
+                    "done_bytes": self.done_bytes,
+                    "elapsed": elapsed,
+                    "throughput": throughput,
+                    "eta": eta,
+                    "status": self.status,
+                    "finished": self.finished,
+                    "cancelled": self._cancel.is_set(),
+                    }
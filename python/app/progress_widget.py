@@ -0,0 +1,114 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+# by importing QT from sgtk rather than directly, we ensure that
+# the code will be compatible with both PySide and PyQt.
+from sgtk.platform.qt import QtCore, QtGui
+
+
+def format_bytes(num_bytes):
+    """
+    Returns a human readable size, e.g. '1.5 GB'.
+    """
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(num_bytes) < 1024.0:
+            return "%.1f %s" % (num_bytes, unit)
+        num_bytes /= 1024.0
+    return "%.1f TB" % num_bytes
+
+
+def format_duration(seconds):
+    """
+    Returns a duration as h:mm:ss.
+    """
+    seconds = int(round(seconds))
+    return "%d:%02d:%02d" % (seconds // 3600, (seconds // 60) % 60, seconds % 60)
+
+
+class ProgressWidget(QtGui.QWidget):
+    """
+    Non-modal widget showing the progress of a background collection.
+
+    The widget polls a CollectionProgress on a timer rather than being driven
+    by the copy threads, so it never touches Qt from outside the main thread.
+    """
+
+    # How often the display is refreshed, in milliseconds.
+    REFRESH_INTERVAL = 250
+
+    def __init__(self, progress):
+        """
+        Constructor
+
+        :progress:  CollectionProgress to display and cancel.
+        """
+        QtGui.QWidget.__init__(self)
+        self._progress = progress
+
+        self._status_label = QtGui.QLabel(self)
+        self._progress_bar = QtGui.QProgressBar(self)
+        self._progress_bar.setRange(0, 1000)
+        self._details_label = QtGui.QLabel(self)
+        self._cancel_button = QtGui.QPushButton("Cancel", self)
+        self._cancel_button.clicked.connect(self._on_cancel)
+
+        button_layout = QtGui.QHBoxLayout()
+        button_layout.addStretch()
+        button_layout.addWidget(self._cancel_button)
+
+        layout = QtGui.QVBoxLayout(self)
+        layout.addWidget(self._status_label)
+        layout.addWidget(self._progress_bar)
+        layout.addWidget(self._details_label)
+        layout.addLayout(button_layout)
+        self.setMinimumWidth(420)
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.timeout.connect(self._refresh)
+        self._timer.start(self.REFRESH_INTERVAL)
+        self._refresh()
+
+    def _on_cancel(self):
+        """
+        Cancels the collection, or closes the widget once it has finished.
+        """
+        if self._progress.snapshot()["finished"]:
+            self.close()
+        else:
+            self._progress.cancel()
+            self._cancel_button.setEnabled(False)
+
+    def _refresh(self):
+        """
+        Updates the display from the current progress snapshot.
+        """
+        snapshot = self._progress.snapshot()
+
+        self._status_label.setText(snapshot["status"])
+        if snapshot["total_bytes"]:
+            fraction = float(snapshot["done_bytes"]) / snapshot["total_bytes"]
+            self._progress_bar.setValue(int(min(1.0, fraction) * 1000))
+        elif snapshot["finished"]:
+            self._progress_bar.setValue(1000)
+
+        details = "%d of %d files, %s of %s" % (snapshot["done_files"],
+                                              snapshot["total_files"],
+                                              format_bytes(snapshot["done_bytes"]),
+                                              format_bytes(snapshot["total_bytes"]))
+        if snapshot["throughput"]:
+            details += "\n%s/s" % format_bytes(snapshot["throughput"])
+            if snapshot["eta"] is not None and not snapshot["finished"]:
+                details += ", about %s remaining" % format_duration(snapshot["eta"])
+        self._details_label.setText(details)
+
+        if snapshot["finished"]:
+            self._timer.stop()
+            self._cancel_button.setText("Close")
+            self._cancel_button.setEnabled(True)
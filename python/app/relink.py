@@ -0,0 +1,144 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import heapq
+import threading
+
+
+class RelinkQueue(object):
+    """
+    Hands out tasks for their references to be updated as soon as every
+    file they need has been copied, rather than once the whole collection
+    has finished, so one slow file doesn't hold back the rest of the scene.
+
+    The copy workers report each file as it finishes, the main thread adds
+    tasks as they are planned and takes whichever are ready. Tasks that are
+    ready at the same time are handed out smallest first.
+    """
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._condition = threading.Condition()
+        # PlannedFiles queued for copying that haven't finished yet
+        self._copying = set()
+        # first failure of each PlannedFile that failed to copy
+        self._failed = {}
+        # task index -> [number of files still copying, bytes to copy]
+        self._waiting = {}
+        # first failure of each task, as a (source_path, exception) tuple
+        self._failures = {}
+        # heap of (bytes to copy, task index) for the tasks ready to relink
+        self._ready = []
+        self._closed = False
+
+    def copying(self, planned_files):
+        """
+        Records files about to be queued for copying. Must be called before
+        they are submitted, so they can't finish before they're known.
+        """
+        with self._condition:
+            self._copying.update(planned_files)
+
+    def add_task(self, index, planned_files, num_bytes=0):
+        """
+        Adds a task, which becomes ready once none of its files are still
+        copying. That may be straight away.
+
+        :index:         Index of the task in the task list.
+        :planned_files: Every PlannedFile the task needs, including those
+                        planned by earlier tasks. A file listed more than
+                        once is only waited for once.
+        :num_bytes:     Size of the task, smaller tasks are handed out first.
+        """
+        with self._condition:
+            left = 0
+            for planned in set(planned_files):
+                if planned in self._copying:
+                    left += 1
+                elif planned in self._failed:
+                    self._failures.setdefault(index, self._failed[planned])
+            if left:
+                self._waiting[index] = [left, num_bytes]
+            else:
+                heapq.heappush(self._ready, (num_bytes, index))
+                self._condition.notify_all()
+
+    def file_done(self, planned, error=None):
+        """
+        Records a file that finished copying, or failed with the exception
+        'error'. Called from the copy workers.
+        """
+        with self._condition:
+            self._copying.discard(planned)
+            if error is not None:
+                self._failed[planned] = (planned.source, error)
+            for index in planned.task_indices:
+                if error is not None:
+                    self._failures.setdefault(index, (planned.source, error))
+                waiting = self._waiting.get(index)
+                if waiting is None:
+                    # not added yet, add_task will see the file is done
+                    continue
+                waiting[0] -= 1
+                if not waiting[0]:
+                    del self._waiting[index]
+                    heapq.heappush(self._ready, (waiting[1], index))
+                    self._condition.notify_all()
+            if self._closed and not self._copying:
+                self._release_waiting()
+
+    def close(self):
+        """
+        Marks that no more tasks will be added. Once no file is left
+        copying, any task still waiting is handed out too, so take() can't
+        wait on it forever.
+        """
+        with self._condition:
+            self._closed = True
+            if not self._copying:
+                self._release_waiting()
+            self._condition.notify_all()
+
+    def _release_waiting(self):
+        """
+        Moves every waiting task to the ready tasks. Must be called with the
+        condition held.
+        """
+        if not self._waiting:
+            return
+        for index, (left, num_bytes) in self._waiting.items():
+            heapq.heappush(self._ready, (num_bytes, index))
+        self._waiting.clear()
+        self._condition.notify_all()
+
+    def take(self, timeout=None):
+        """
+        Waits for tasks to become ready, for at most 'timeout' seconds if
+        given, and takes every one that is.
+
+        :returns:   List of (task index, failure) tuples, smallest task
+                    first, where failure is None or the (source_path,
+                    exception) tuple of a file the task needed that failed
+                    to copy. Empty if nothing became ready in time, and
+                    None once closed with every task handed out.
+        """
+        with self._condition:
+            if not self._ready:
+                if self._closed and not self._waiting:
+                    return None
+                if timeout != 0:
+                    self._condition.wait(timeout)
+            ready = []
+            while self._ready:
+                num_bytes, index = heapq.heappop(self._ready)
+                ready.append((index, self._failures.pop(index, None)))
+            return ready
@@ -0,0 +1,106 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import re
+import threading
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = dict
+
+# matches the version in a file name such as 'plate_v003.%04d.exr'
+VERSION_RE = re.compile(r"_v([0-9]{2,5})")
+
+
+def parse_version(path, default_pass):
+    """
+    Works out the 'pass' and 'version' template fields from a file path.
+
+    :path:          File path.
+    :default_pass:  Pass to use when the path has no version in it.
+
+    :returns:       Tuple (pass, version). The version is the first one found
+                    in the path and defaults to 1. The pass is the part of the
+                    file name before that version.
+    """
+    match = VERSION_RE.search(path)
+    if match:
+        file_name = os.path.basename(path.replace("\\", "/"))
+        return file_name.split(match.group(0))[0], int(match.group(1))
+    return default_pass, 1
+
+
+class TemplateResolver(object):
+    """
+    Resolves destination templates for the scan hooks.
+
+    The base fields for each context and template are only looked up once,
+    and resolved paths are memoized on (template, pass, version) with an LRU
+    bound, since a scene usually has many objects that resolve to the same
+    destination. Every resolution starts from a fresh copy of the base
+    fields, so nothing leaks from one object into the next.
+    """
+
+    def __init__(self, max_size=1024):
+        """
+        Constructor
+
+        :max_size:  Maximum number of resolved paths to keep.
+        """
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._base_fields = {}
+        self._paths = OrderedDict()
+
+    def base_fields(self, context, template):
+        """
+        :returns:   The fields 'context' provides for 'template'. Callers must
+                    not modify the returned dictionary.
+        """
+        key = (id(context), template.name)
+        with self._lock:
+            fields = self._base_fields.get(key)
+        if fields is None:
+            fields = context.as_template_fields(template)
+            with self._lock:
+                self._base_fields[key] = fields
+        return fields
+
+    def apply(self, context, template, pass_name=None, version=None):
+        """
+        Resolves 'template' for 'context' with the given pass and version.
+
+        :pass_name: Value of the 'pass' field, or None to leave it out.
+        :version:   Value of the 'version' field, or None to leave it out.
+
+        :returns:   The resolved path.
+        """
+        key = (id(context), template.name, pass_name, version)
+        with self._lock:
+            path = self._paths.pop(key, None)
+            if path is not None:
+                # move it to the most recently used end
+                self._paths[key] = path
+                return path
+
+        fields = dict(self.base_fields(context, template))
+        if pass_name is not None:
+            fields["pass"] = pass_name
+        if version is not None:
+            fields["version"] = version
+        path = template.apply_fields(fields)
+
+        with self._lock:
+            self._paths[key] = path
+            while len(self._paths) > self._max_size:
+                self._paths.pop(next(iter(self._paths)))
+        return path
@@ -0,0 +1,205 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import re
+from array import array
+
+# The frame tokens we understand, tried in this order:
+#   %04d, %d        printf style, as used by Nuke
+#   ####, #         hashes, one per digit
+#   [1-100]         inclusive frame range, unpadded
+#   [1..100;4]      Softimage frame range, with optional padding
+#   <UDIM>          Mari style UDIM tile numbers
+_TOKEN_RE = re.compile(r"%(?P<printf>0?\d*)d"
+                       r"|(?P<hashes>#+)"
+                       r"|\[(?P<start>-?\d+)(?:-|\.\.)(?P<end>-?\d+)(?:;(?P<pad>\d+))?\]"
+                       r"|(?P<udim><UDIM>)")
+
+
+class SequencePattern(object):
+    """
+    A file name containing a frame token, e.g. 'plate.%04d.exr'.
+
+    Knows how to tell which of the files in a folder belong to the sequence
+    and what frame each of them is, so the sequence can be expanded from a
+    single directory listing rather than a wildcard glob.
+    """
+
+    def __init__(self, prefix, suffix, padding=1, frame_range=None, token=""):
+        """
+        Constructor
+
+        :prefix:        Part of the file name before the frame number.
+        :suffix:        Part of the file name after the frame number.
+        :padding:       Minimum number of digits in a frame number.
+        :frame_range:   Optional inclusive (first, last) tuple the pattern
+                        itself restricts the frames to.
+        :token:         The frame token as written in the file name.
+        """
+        self.prefix = prefix
+        self.suffix = suffix
+        self.padding = padding
+        self.frame_range = frame_range
+        self.token = token
+        self._regex = re.compile("^" + re.escape(prefix) + r"(-?\d+)" + re.escape(suffix) + "$")
+
+    def __repr__(self):
+        return "<SequencePattern %s%s%s>" % (self.prefix, self.token, self.suffix)
+
+    def match(self, name):
+        """
+        :returns:   The frame number of file 'name', or None if the file isn't
+                    part of this sequence.
+        """
+        match = self._regex.match(name)
+        if not match:
+            return None
+        digits = match.group(1)
+        unsigned = digits.lstrip("-")
+        # frames shorter than the padding are zero filled, so a frame number
+        # longer than the padding must not have a leading zero, and one
+        # shorter than the padding can't be part of this sequence.
+        if len(unsigned) < self.padding:
+            return None
+        if len(unsigned) > self.padding and unsigned.startswith("0"):
+            return None
+        frame = int(digits)
+        if self.frame_range and not (self.frame_range[0] <= frame <= self.frame_range[1]):
+            return None
+        return frame
+
+    def filename(self, frame):
+        """
+        :returns:   File name of 'frame'.
+        """
+        if frame < 0:
+            return "%s-%0*d%s" % (self.prefix, self.padding, -frame, self.suffix)
+        return "%s%0*d%s" % (self.prefix, self.padding, frame, self.suffix)
+
+    def frames(self, names, frames=None):
+        """
+        Finds the frames of this sequence in a directory listing.
+
+        :names:     Iterable of file names, e.g. from DirectoryCache.names().
+        :frames:    Optional container of the frames wanted. Other frames
+                    found in 'names' are ignored.
+
+        :returns:   Sorted list of (frame, name) tuples.
+        """
+        found = []
+        for name in names:
+            frame = self.match(name)
+            if frame is None:
+                continue
+            if frames is not None and frame not in frames:
+                continue
+            found.append((frame, name))
+        found.sort()
+        return found
+
+    def files(self, folder, cache, frames=None):
+        """
+        Lists the files of this sequence in 'folder'.
+
+        :folder:    Folder the sequence lives in.
+        :cache:     DirectoryCache used to list the folder.
+        :frames:    Optional container of the frames wanted.
+
+        :returns:   SequenceFiles of the files found, in frame order.
+        """
+        return SequenceFiles(folder, self, [frame for frame, name in self.frames(cache.names(folder), frames)])
+
+
+class SequenceFiles(object):
+    """
+    The files of an image sequence, stored as a folder, a SequencePattern and
+    the frame numbers rather than as a list of paths.
+
+    A 10,000 frame sequence is then a compact array of ints instead of 10,000
+    long path strings, and its target files are the same object with another
+    folder. It behaves as a read only list of paths: it can be iterated,
+    indexed and measured, and paths are only built as they are needed.
+    """
+    __slots__ = ("folder", "pattern", "frames")
+
+    def __init__(self, folder, pattern, frames):
+        """
+        Constructor
+
+        :folder:    Folder the files are in.
+        :pattern:   SequencePattern the file names follow.
+        :frames:    Iterable of the frame numbers, in order.
+        """
+        self.folder = folder
+        self.pattern = pattern
+        self.frames = frames if isinstance(frames, array) else array("l", frames)
+
+    def __repr__(self):
+        return "<SequenceFiles %s, %d frames>" % (os.path.join(self.folder, self.pattern.prefix + self.pattern.token +
+                                                               self.pattern.suffix), len(self.frames))
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self):
+        for frame in self.frames:
+            yield os.path.join(self.folder, self.pattern.filename(frame))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [os.path.join(self.folder, self.pattern.filename(frame)) for frame in self.frames[index]]
+        return os.path.join(self.folder, self.pattern.filename(self.frames[index]))
+
+    def __eq__(self, other):
+        if isinstance(other, SequenceFiles) and other.pattern is self.pattern and other.folder == self.folder:
+            return other.frames == self.frames
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def with_folder(self, folder):
+        """
+        :returns:   The same files in another folder, sharing the frames.
+        """
+        return SequenceFiles(folder, self.pattern, self.frames)
+
+
+def parse_pattern(filename):
+    """
+    Parses the frame token out of a file name.
+
+    :filename:  File name, or path, that may contain a frame token.
+
+    :returns:   SequencePattern for the file name part of 'filename', or None
+                if it doesn't contain a frame token.
+    """
+    name = os.path.basename(filename.replace("\\", "/"))
+    match = _TOKEN_RE.search(name)
+    if not match:
+        return None
+
+    prefix = name[:match.start()]
+    suffix = name[match.end():]
+    token = match.group(0)
+    if match.group("printf") is not None:
+        padding = int(match.group("printf") or 1)
+        return SequencePattern(prefix, suffix, max(1, padding), token=token)
+    if match.group("hashes"):
+        return SequencePattern(prefix, suffix, len(match.group("hashes")), token=token)
+    if match.group("udim"):
+        return SequencePattern(prefix, suffix, 4, frame_range=(1001, 9999), token=token)
+
+    first = int(match.group("start"))
+    last = int(match.group("end"))
+    padding = int(match.group("pad") or 1)
+    return SequencePattern(prefix, suffix, padding, frame_range=(min(first, last), max(first, last)),
+                           token=token)
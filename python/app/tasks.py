@@ -0,0 +1,117 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+
+class CollectionTask(object):
+    """
+    A scene object whose files need collecting, as returned by the scan scene
+    hooks.
+
+    Slotted, so a scene with thousands of objects doesn't carry a dictionary
+    per task, and meant to be given a sequences.SequenceFiles rather than a
+    list for the source and target files of an image sequence. It also acts
+    as the task dictionary hooks have always been given, so custom hooks
+    that use task["source_files"], task.get("other_params") and so on keep
+    working. Keys other than the standard ones are kept in a dictionary of
+    their own.
+    """
+    __slots__ = ("type", "name", "source_files", "target_files", "error", "error_message", "other_params",
+                 "_extra")
+
+    KEYS = ("type", "name", "source_files", "target_files", "error", "error_message", "other_params")
+
+    def __init__(self, type, name, source_files, target_files, other_params=None, error=False):
+        """
+        Constructor
+
+        :type:          Scene item type, as in the scene_item_types setting.
+        :name:          Name of the scene object.
+        :source_files:  List (or SequenceFiles) of the files to copy.
+        :target_files:  List (or SequenceFiles) of where each source goes.
+        :other_params:  Dictionary passed on to the update references hook.
+        """
+        self.type = type
+        self.name = name
+        self.source_files = source_files
+        self.target_files = target_files
+        self.error = error
+        self.error_message = None
+        self.other_params = other_params if other_params is not None else {}
+        self._extra = None
+
+    def __repr__(self):
+        return "<CollectionTask %s %s, %d files>" % (self.type, self.name, len(self.source_files))
+
+    # dictionary compatibility
+
+    def __getitem__(self, key):
+        if key in self.KEYS:
+            value = getattr(self, key)
+            if value is None and key == "error_message":
+                # an unset message reads as a missing key, as it did in a dict
+                raise KeyError(key)
+            return value
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if key in self.KEYS:
+            setattr(self, key, value)
+            return
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self.KEYS:
+            if key != "error_message" or self.error_message is None:
+                raise KeyError(key)
+            self.error_message = None
+            return
+        if self._extra is None:
+            raise KeyError(key)
+        del self._extra[key]
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def keys(self):
+        keys = [key for key in self.KEYS if key != "error_message" or self.error_message is not None]
+        if self._extra:
+            keys += list(self._extra)
+        return keys
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
@@ -0,0 +1,147 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Collects the external files of many Nuke scripts, one Nuke process per
+script, running several at once. Meant for consolidating a whole sequence
+overnight on a farm node:
+
+    python scripts/collect_batch.py --nuke /usr/local/Nuke9.0v8/Nuke9.0 a.nk b.nk
+    python scripts/collect_batch.py --nuke Nuke9.0 --project-path /mnt/projects/foo --sequence sq010
+
+Given a sequence or shot codes, the latest version of each Nuke work file of
+those shots is found through the work file template. Each script is handled
+by collect_nuke_script.py under 'nuke -t'; the combined outcome is printed,
+and written to --output, as JSON. Exits non zero if any script failed.
+"""
+
+import os
+import sys
+import json
+import shutil
+import optparse
+import tempfile
+import subprocess
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "collect_nuke_script.py")
+
+
+def find_shot_scripts(project_path, sequence=None, shots=(), template_name="nuke_shot_work"):
+    """
+    Finds the latest version of each Nuke work file of the given shots.
+
+    :project_path:  Any path inside the Toolkit project.
+    :sequence:      Code of a sequence, all of whose shots are used.
+    :shots:         Codes of individual shots.
+    :template_name: Name of the work file template.
+
+    :returns:   Sorted list of script paths.
+    """
+    import sgtk
+
+    tk = sgtk.sgtk_from_path(project_path)
+    template = tk.templates.get(template_name)
+    if template is None:
+        raise sgtk.TankError("No template called '%s' in the project configuration" % template_name)
+    project = tk.context_from_path(project_path).project
+
+    filters = [["project", "is", project]]
+    if sequence:
+        filters.append(["sg_sequence.Sequence.code", "is", sequence])
+    if shots:
+        filters.append(["code", "in", list(shots)])
+    shot_entities = tk.shotgun.find("Shot", filters, ["code"])
+
+    scripts = []
+    for shot in shot_entities:
+        context = tk.context_from_entity("Shot", shot["id"])
+        fields = context.as_template_fields(template)
+        latest = {}
+        for path in tk.paths_from_template(template, fields, skip_keys=["version", "name"]):
+            path_fields = template.get_fields(path)
+            name = path_fields.get("name")
+            version = path_fields.get("version", 0)
+            if name not in latest or version > latest[name][0]:
+                latest[name] = (version, path)
+        scripts += [path for version, path in latest.values()]
+    return sorted(scripts)
+
+
+def collect_script(args):
+    """
+    Runs collect_nuke_script.py on one script in its own Nuke process.
+
+    :returns:   Result dictionary written by the worker, or a failure result
+                if the worker didn't get as far as writing one.
+    """
+    nuke_executable, script, overwrite_policy, temp_folder = args
+    result_path = os.path.join(temp_folder, "%s.json" % abs(hash(script)))
+    command = [nuke_executable, "-t", WORKER_SCRIPT, script,
+               "--overwrite", overwrite_policy, "--result", result_path]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.communicate()[0]
+
+    try:
+        with open(result_path) as f:
+            result = json.load(f)
+    except (IOError, ValueError):
+        result = {"script": script, "success": False}
+        result["log"] = output.decode("utf-8", "replace")[-4096:]
+    result["returncode"] = process.returncode
+    return result
+
+
+def main(argv):
+    parser = optparse.OptionParser(usage="%prog --nuke NUKE [options] [SCRIPT.nk ...]")
+    parser.add_option("--nuke", help="Nuke executable to run the scripts with")
+    parser.add_option("--project-path", help="path inside the Toolkit project, used with --sequence and --shot")
+    parser.add_option("--sequence", help="collect the latest work files of every shot in this sequence")
+    parser.add_option("--shot", action="append", default=[], help="collect the latest work files of this shot")
+    parser.add_option("--template", default="nuke_shot_work", help="work file template [%default]")
+    parser.add_option("--overwrite", default="never", choices=["always", "never"],
+                      help="overwrite files that already exist in the project (always/never) [%default]")
+    parser.add_option("--processes", type="int", default=max(1, multiprocessing.cpu_count() // 2),
+                      help="number of Nuke processes to run at once [%default]")
+    parser.add_option("--output", help="also write the results as JSON to this file")
+    options, scripts = parser.parse_args(argv)
+
+    if not options.nuke:
+        parser.error("--nuke is required")
+    if options.sequence or options.shot:
+        if not options.project_path:
+            parser.error("--project-path is required with --sequence and --shot")
+        scripts += find_shot_scripts(options.project_path, options.sequence, options.shot, options.template)
+    if not scripts:
+        parser.error("no Nuke scripts to collect")
+
+    temp_folder = tempfile.mkdtemp(prefix="collect_batch_")
+    pool = ThreadPool(max(1, options.processes))
+    try:
+        jobs = [(options.nuke, script, options.overwrite, temp_folder) for script in scripts]
+        results = pool.map(collect_script, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+    failed = [result["script"] for result in results if not result["success"]]
+    output = json.dumps({"scripts": len(results), "failed": failed, "results": results},
+                        indent=4, sort_keys=True)
+    print(output)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(output)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
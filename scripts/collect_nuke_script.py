@@ -0,0 +1,101 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Collects the external files of a single Nuke script without any UI, then
+saves the script. Runs under Nuke's terminal mode:
+
+    nuke -t scripts/collect_nuke_script.py /path/to/shot_v003.nk --overwrite never
+
+Toolkit is started from the script's own path, so the script must live in a
+Toolkit project and sgtk must be importable, e.g. from the project's
+install/core/python folder on PYTHONPATH. The outcome is printed as JSON,
+and written to --result when given; collect_batch.py uses this to run many
+scripts on the farm.
+"""
+
+import sys
+import json
+import optparse
+import traceback
+
+import nuke
+import sgtk
+
+APP_NAME = "tk-multi-collectfiles"
+
+
+def find_app(engine):
+    """
+    :returns:   The collect files app running in 'engine'.
+    """
+    app = engine.apps.get(APP_NAME)
+    if app is None:
+        # the app may be registered under another instance name
+        for app in engine.apps.values():
+            if hasattr(app, "collect_headless"):
+                break
+        else:
+            raise sgtk.TankError("%s is not configured for the environment of this script" % APP_NAME)
+    return app
+
+
+def collect(script_path, overwrite_policy):
+    """
+    Opens 'script_path', collects its external files and saves it.
+
+    :returns:   Result dictionary from the app's collect_headless method.
+    """
+    nuke.scriptOpen(script_path)
+
+    tk = sgtk.sgtk_from_path(script_path)
+    context = tk.context_from_path(script_path)
+    engine = sgtk.platform.current_engine()
+    if engine is None:
+        engine = sgtk.platform.start_engine("tk-nuke", tk, context)
+    elif engine.context != context:
+        sgtk.platform.change_context(context)
+
+    try:
+        result = find_app(engine).collect_headless(overwrite_policy)
+        if result["updated"]:
+            nuke.scriptSave()
+        return result
+    finally:
+        engine.destroy()
+
+
+def main(argv):
+    parser = optparse.OptionParser(usage="nuke -t %prog [options] SCRIPT.nk")
+    parser.add_option("--overwrite", default="never", choices=["always", "never"],
+                      help="overwrite files that already exist in the project (always/never) [%default]")
+    parser.add_option("--result", help="also write the outcome as JSON to this file")
+    options, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.error("expected the path of one Nuke script")
+
+    result = {"script": args[0]}
+    try:
+        result.update(collect(args[0], options.overwrite))
+        result["success"] = not result["errors"]
+    except Exception:
+        result["success"] = False
+        result["exception"] = traceback.format_exc()
+
+    output = json.dumps(result, indent=4, sort_keys=True)
+    print(output)
+    if options.result:
+        with open(options.result, "w") as f:
+            f.write(output)
+    return 0 if result["success"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))